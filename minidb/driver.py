@@ -1,12 +1,95 @@
+import base64
+import binascii
+import json
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 
 
 class QueryResponse(object):
-  def __init__(self, data, total, offset, page_size):
+  __slots__ = ('data', 'total', 'offset', 'page_size', 'next_cursor')
+
+  def __init__(self, data, total, offset, page_size, next_cursor=None):
     self.data = data
     self.total = total
     self.offset = offset
     self.page_size = page_size
+    self.next_cursor = next_cursor
+
+
+class ResultCache(object):
+  # In-process LRU of full result lists. Every key embeds the version of its
+  # table, so bumping the version on writes makes older entries unreachable
+  # until they are evicted. Writes made by other processes or through raw
+  # `query` calls are not tracked; `ttl` (seconds) bounds that staleness.
+  # Pooled reads run on several threads, so every access holds `_lock`.
+  def __init__(self, maxsize: int, ttl: float = None):
+    if maxsize < 1:
+      raise ValueError('`maxsize` must be greater than 0')
+
+    self._maxsize = maxsize
+    self._ttl = ttl
+    self._entries = OrderedDict()
+    self._versions = {}
+    self._lock = threading.Lock()
+
+  def key(self, table_name, *args):
+    with self._lock:
+      return (table_name, self._versions.get(table_name, 0)) + args
+
+  def get(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+
+      expires_at, value = entry
+      if not expires_at is None and expires_at < time.monotonic():
+        del self._entries[key]
+        return None
+
+      self._entries.move_to_end(key)
+      return value
+
+  def put(self, key, value):
+    expires_at = None if self._ttl is None else time.monotonic() + self._ttl
+    with self._lock:
+      self._entries[key] = (expires_at, value)
+      self._entries.move_to_end(key)
+      if len(self._entries) > self._maxsize:
+        self._entries.popitem(last=False)
+
+  def invalidate(self, table_name):
+    with self._lock:
+      self._versions[table_name] = self._versions.get(table_name, 0) + 1
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+
+def _freeze(value):
+  if isinstance(value, dict):
+    return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+  if isinstance(value, (list, tuple)):
+    return tuple(_freeze(v) for v in value)
+  return value
+
+
+def _encode_cursor(values):
+  return base64.urlsafe_b64encode(
+      json.dumps(list(values)).encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor, size):
+  try:
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+  except (binascii.Error, UnicodeError, ValueError):
+    raise ValueError('"cursor" is invalid')
+  if not isinstance(values, list) or len(values) != size:
+    raise ValueError('"cursor" is invalid')
+  return values
 
 
 class PartitionKey(object):
@@ -17,6 +100,10 @@ class PartitionKey(object):
 
 class Driver(ABC):
   MAX_PAGE_SIZE = 1000
+  # Cursor requesting the first page of a keyset paginated `search`
+  FIRST_PAGE_CURSOR = ''
+
+  _result_cache: ResultCache = None
 
   @abstractmethod
   def create_table(self):
@@ -34,47 +121,126 @@ class Driver(ABC):
   def rollback(self):
     pass
 
+  @abstractmethod
+  def atomic(self):
+    pass
+
   @abstractmethod
   def count(self, t, criteria=None, partition_key=None, term=None):
     pass
 
+  @abstractmethod
+  def exists(self, t, criteria=None, partition_key=None):
+    pass
+
   @abstractmethod
   def find_one(self, t, key):
     pass
 
   @abstractmethod
-  def find(self, t, criteria=None, sort=None, limit=None, offset=None, partition_key=None, term=None):
+  def find(self, t, criteria=None, sort=None, limit=None, offset=None, partition_key=None, term=None, stream=False):
+    pass
+
+  @abstractmethod
+  def find_after(self, t, criteria=None, limit=None, after_key=None, partition_key=None):
     pass
 
   @abstractmethod
   def add(self, t, model):
     pass
 
+  @abstractmethod
+  def add_many(self, t, models, chunk_size=500, fetch_keys=True):
+    pass
+
   @abstractmethod
   def update(self, t, model):
     pass
 
+  @abstractmethod
+  def update_many(self, t, models):
+    pass
+
   @abstractmethod
   def remove(self, t, key):
     pass
 
   @abstractmethod
-  def query(self, t, sql, sql_params=None):
+  def remove_many(self, t, keys):
+    pass
+
+  @abstractmethod
+  def query(self, t, sql, sql_params=None, stream=False):
     pass
 
-  def search(self, t, criteria=None, sort=None, limit=None, offset=None, partition_key=None, term=None):
+  # Without `offset`, `sort` and `term` pages are read in primary key order
+  # using keyset pagination: pass the `next_cursor` of a response as `cursor`
+  # to fetch the following page, the cost of which does not depend on how
+  # deep into the result set it is. `next_cursor` is None on the last page.
+  # `offset` pagination is deprecated; it is kept for custom sorts and
+  # full-text searches. `total` is only computed, with an extra COUNT query,
+  # when `include_total` is set.
+  def search(self, t, criteria=None, sort=None, limit=None, offset=None, partition_key=None, term=None, cursor=None, include_total=False):
     if limit is None:
       limit = self.__class__.MAX_PAGE_SIZE
     elif limit < 0:
       raise ValueError('"limit" must be greater than 0')
     elif limit > self.__class__.MAX_PAGE_SIZE:
       raise ValueError('"limit" exceeds the configured MAX_PAGE_SIZE')
+
+    # Keyset pagination: pages are ordered by primary key and `cursor`
+    # (FIRST_PAGE_CURSOR to start) encodes the key of the last row returned
+    if not cursor is None:
+      if not (offset is None and sort is None and term is None):
+        raise ValueError(
+            '"cursor" cannot be combined with "offset", "sort" or "term"')
+      if not self._keyset_supported(t):
+        raise ValueError(
+            '"cursor": `%s` has no key suitable for keyset pagination'
+            % t.__table__.name)
+
+      total = None
+      if include_total:
+        total = self.count(
+            t, criteria=criteria, partition_key=partition_key, term=term
+        )
+
+      after_key = None
+      if cursor != self.__class__.FIRST_PAGE_CURSOR:
+        after_key = self._cursor_key(t, _decode_cursor(
+            cursor, len(t.__table__.primary_key)))
+      data = self.find_after(
+          t, criteria=criteria, limit=limit + 1,
+          after_key=after_key, partition_key=partition_key
+      )
+      next_cursor = None
+      if len(data) > limit:
+        data = data[:limit]
+        if limit > 0:
+          next_cursor = _encode_cursor(self._cursor_values(t, data[-1]))
+      return QueryResponse(data, total, None, limit, next_cursor)
+
     offset = offset or 0
+    cache_key = self._result_cache_key(t, criteria, sort, partition_key, term)
+    if not cache_key is None:
+      # Cached pages share model instances; they must not be mutated
+      # without going through `update`.
+      rows = self._result_cache.get(cache_key)
+      if rows is None:
+        rows = self.find(
+            t, criteria=criteria, sort=sort, partition_key=partition_key, term=term
+        )
+        self._result_cache.put(cache_key, rows)
+      total = len(rows) if include_total else None
+      return QueryResponse(rows[offset:offset + limit], total, offset, limit)
 
-    total = self.count(
-        t, criteria=criteria, partition_key=partition_key, term=term
-    )
-    
+    total = None
+    if include_total:
+      total = self.count(
+          t, criteria=criteria, partition_key=partition_key, term=term
+      )
+      if offset >= total:
+        return QueryResponse([], total, offset, limit)
     data = self.find(
         t, criteria=criteria, sort=sort,
         limit=limit, offset=offset, partition_key=partition_key, term=term
@@ -82,6 +248,41 @@ class Driver(ABC):
 
     return QueryResponse(data, total, offset, limit)
 
+  # Keyset pagination hooks. Drivers report whether `t` has a unique key to
+  # page by, and convert between models, cursor values and `find_after` keys.
+  def _keyset_supported(self, t):
+    return len(t.__table__.primary_key) > 0
+
+  def _cursor_values(self, t, model):
+    return [getattr(model, attr_name) for attr_name in t.__table__.primary_key]
+
+  def _cursor_key(self, t, values):
+    primary_key = t.__table__.primary_key
+    if len(primary_key) > 1:
+      return dict(zip(primary_key, values))
+    return values[0]
+
+  def _result_cache_key(self, t, criteria, sort, partition_key, term):
+    if self._result_cache is None:
+      return None
+
+    key = self._result_cache.key(
+        t.__table__.name,
+        _freeze(criteria),
+        _freeze(sort),
+        None if partition_key is None else _freeze(vars(partition_key)),
+        term,
+    )
+    try:
+      hash(key)
+    except TypeError:
+      return None
+    return key
+
+  def _invalidate_results(self, table_name):
+    if not self._result_cache is None:
+      self._result_cache.invalidate(table_name)
+
   class DataValidationError(Exception):
     def __init__(self, collection_name, errors):
       super().__init__(
@@ -7,9 +7,12 @@ _log = logging.getLogger(__name__)
 
 
 class TableMetadata(object):
+  __slots__ = ('name', 'columns', 'column_names', 'primary_key')
+
   def __init__(self, name, columns: Dict[str, Column], primary_key: List[str]):
     self.name = name
     self.columns = columns
+    self.column_names = tuple(columns.keys())
     self.primary_key = primary_key
 
 
@@ -22,7 +25,7 @@ class ModelMetadata(object):
     driver.begin_transaction()
     try:
       for table_name, table_info in self._metadata.items():
-        _log.info('Creating table `%s`' % table_name)
+        _log.info('Creating table `%s`', table_name)
         driver.create_table(table_name, table_info)
 
       if not self._initializer is None:
@@ -38,14 +41,58 @@ class ModelMetadata(object):
     return self._metadata[name]
 
 
+def _compile(name, lines, namespace):
+  exec('\n'.join(lines), namespace)
+  return namespace[name]
+
+
+def compile_init(column_names):
+  lines = ['def __init__(self, **attrs):']
+  for attr_name in column_names:
+    lines.append('  self.%s = attrs.get(%r)' % (attr_name, attr_name))
+  if len(column_names) == 0:
+    lines.append('  pass')
+  return _compile('__init__', lines, {})
+
+
+def compile_row_reader(cls, column_names, decoders=None, nullable=None, missing=()):
+  # Generates a straight-line `from_row(row)` that builds a `cls` instance
+  # from a positional row without going through `__init__`. `decoders` and
+  # `nullable` are aligned with `column_names`; `None` decoders copy the
+  # value as is, other decoders are applied directly to columns known to be
+  # non-nullable and behind a null check otherwise. Row values whose column
+  # name is `None` are skipped and the attributes in `missing` are set to
+  # `None`.
+  namespace = {'_new': object.__new__, '_cls': cls}
+  lines = ['def from_row(row):']
+  if len(column_names) > 0:
+    lines.append('  %s, = row' % ', '.join(
+        ['v%d' % i for i in range(len(column_names))]))
+  lines.append('  o = _new(_cls)')
+  decoder = None
+  for i, attr_name in enumerate(column_names):
+    decoder = None if decoders is None else decoders[i]
+    if attr_name is None:
+      continue
+    if decoder is None:
+      lines.append('  o.%s = v%d' % (attr_name, i))
+    elif not nullable is None and not nullable[i]:
+      namespace['_decode_%d' % i] = decoder
+      lines.append('  o.%s = _decode_%d(v%d)' % (attr_name, i, i))
+    else:
+      namespace['_decode_%d' % i] = decoder
+      lines.append('  o.%s = None if v%d is None else _decode_%d(v%d)' %
+                   (attr_name, i, i, i))
+  for attr_name in missing:
+    lines.append('  o.%s = None' % attr_name)
+  lines.append('  return o')
+  return _compile('from_row', lines, namespace)
+
+
 class Document(object):
   def __init__(self, **attrs):
-    metadata = getattr(self, '__table__')
-    for attr_name in metadata.columns:
-      if attr_name in attrs:
-        setattr(self, attr_name, attrs[attr_name])
-      else:
-        setattr(self, attr_name, None)
+    for attr_name in self.__table__.column_names:
+      setattr(self, attr_name, attrs.get(attr_name))
 
 
 def get_model_builder():
@@ -68,6 +115,10 @@ def get_model_builder():
             primary_key=primary_key
         )
         dt.__table__ = metadata[table_name]
+        if not '__init__' in vars(dt):
+          dt.__init__ = compile_init(metadata[table_name].column_names)
+        dt.from_row = staticmethod(compile_row_reader(
+            dt, metadata[table_name].column_names))
       _ModelBuilder.metadata = ModelMetadata(
           metadata, initializer=_ModelBuilder.initializer)
 
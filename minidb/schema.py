@@ -31,6 +31,9 @@ class Date(Primitive):
 
 
 class Column(object):
+  __slots__ = ('column_type', 'nullable', 'autoincrement',
+               'primary_key', 'generator', 'analyze')
+
   def __init__(self, column_type, nullable=False, autoincrement=False, primary_key=False, generator=None, analyze=None):
     if autoincrement == True and not isinstance(column_type, Integer):
       raise ValueError(
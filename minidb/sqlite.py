@@ -1,36 +1,444 @@
 import logging
+import os
+import queue
 import sqlite3
+import threading
 import time
+from contextlib import contextmanager
+from functools import lru_cache
 from datetime import datetime
+from itertools import islice
+from operator import itemgetter
+from urllib.request import pathname2url
 
-from .driver import Driver
-from .model import ModelMetadata, TableMetadata
+from .driver import Driver, ResultCache
+from .model import ModelMetadata, TableMetadata, compile_row_reader
 from .schema import Bit, Blob, Column, Date, Float, Integer, String
 
 _log = logging.getLogger(__name__)
 
 
-def _and(*criterias):
-  result = ' AND '.join(criterias)
-  if len(criterias) > 1:
-    result = '(' + result + ')'
-  return result
+# Filters are only ever combined with AND, so no fragment needs parentheses
+_AND = ' AND '
+
+# Comparison operators accepted as `{'$<name>': [column name, value]}`
+_OPERATORS = {
+    'eq': '=',
+    'ne': '<>',
+    'gt': '>',
+    'gte': '>=',
+    'lt': '<',
+    'lte': '<=',
+}
+
+_TYPE_SQL = {
+    Integer: 'INTEGER',
+    Bit: 'INTEGER',
+    Float: 'REAL',
+    String: 'TEXT',
+    Date: 'INTEGER',
+    Blob: 'BLOB',
+}
+
+
+def _typename_sql(t):
+  cls = type(t)
+  if not cls in _TYPE_SQL:
+    for base in cls.__mro__:
+      if base in _TYPE_SQL:
+        _TYPE_SQL[cls] = _TYPE_SQL[base]
+        break
+    else:
+      raise NotImplementedError()
+  return _TYPE_SQL[cls]
+
+
+@lru_cache(maxsize=256)
+def _sort_sql(criteria: tuple, prefix=None):
+  # `criteria` items are known to be tuples; the rest is checked once per
+  # distinct sort.
+  criterias_sql = []
+  for c in criteria:
+    if len(c) != 2:
+      raise ValueError('`criteria` items must contain exactly 2 values')
+
+    attr_name, sort_dir = c
+
+    if sort_dir != 'ASC' and sort_dir != 'DESC':
+      raise ValueError(
+          '`criteria` items sort direction must be either "ASC" or "DESC"')
+
+    if not prefix is None:
+      attr_name = prefix + '.' + attr_name
+
+    criterias_sql.append('%s %s' % (attr_name, sort_dir))
+
+  return 'ORDER BY ' + ', '.join(criterias_sql)
+
+
+def _fts_rowid_column(schema: TableMetadata):
+  # Name of the INTEGER PRIMARY KEY of `schema`, which aliases the rowid and
+  # can back an external content FTS5 table, or None.
+  if len(schema.primary_key) != 1:
+    return None
+  col_name = schema.primary_key[0]
+  c = schema.columns[col_name]
+  if c.autoincrement and isinstance(c.column_type, Integer):
+    return col_name
+  return None
+
+
+def _encode_date(value):
+  return value.timestamp()
+
+
+def _codecs(column_type):
+  # Returns the `(encoder, decoder)` pair for a column type; `None` means the
+  # value is passed through to/from sqlite3 unchanged.
+  if isinstance(column_type, Date):
+    return _encode_date, datetime.fromtimestamp
+  return None, None
+
+
+def _compile_row_mapper(columns, infos, encoders, generate_keys=True):
+  # Generates `map_row(model)` returning the encoded values aligned with
+  # `columns` and the list of validation errors, with the generator, null
+  # check and encoder of every column inlined. Without `generate_keys`,
+  # primary key columns are read from the model even if they have a
+  # generator, so that updates target the stored key.
+  namespace = {}
+  lines = ['def map_row(model):', '  errors = []']
+  for i, (attr_name, attr_info, encoder) in enumerate(zip(columns, infos, encoders)):
+    if attr_info.generator and (generate_keys or not attr_info.primary_key):
+      namespace['_generate_%d' % i] = attr_info.generator
+      lines.append('  v%d = _generate_%d()' % (i, i))
+      lines.append('  model.%s = v%d' % (attr_name, i))
+    else:
+      lines.append('  v%d = model.%s' % (i, attr_name))
+
+    if not attr_info.nullable:
+      lines.append('  if v%d is None:' % i)
+      lines.append('    errors.append(%r)' % (
+          '`%s`: value is null but the column is marked as not nullable'
+          % attr_name))
+    if not encoder is None:
+      namespace['_encode_%d' % i] = encoder
+      lines.append('  if not v%d is None:' % i)
+      lines.append('    v%d = _encode_%d(v%d)' % (i, i, i))
+  lines.append('  return (%s), errors' % ''.join(
+      ['v%d, ' % i for i in range(len(columns))]))
+  exec('\n'.join(lines), namespace)
+  return namespace['map_row']
+
+
+class _TablePlan(object):
+  MAX_WHERE_TEMPLATES = 256
+
+  def __init__(self, t: type, fts_table_prefix: str):
+    schema: TableMetadata = t.__table__
+    self.t = t
+    self.schema = schema
+    self.columns = schema.column_names
+    self.column_infos = tuple(schema.columns.values())
+    codecs = [_codecs(c.column_type) for c in self.column_infos]
+    self.encoders = tuple(enc for enc, dec in codecs)
+    self.decoders = tuple(dec for enc, dec in codecs)
+    self.column_encoders = dict(zip(self.columns, self.encoders))
+    self._where_templates = {}
+    self._readers = {}
+    self.from_row = compile_row_reader(
+        t, self.columns, self.decoders,
+        nullable=tuple(c.nullable for c in self.column_infos))
+    self.primary_key = tuple(schema.primary_key)
+    self.insert_cols = tuple(
+        k for k, v in schema.columns.items() if not v.autoincrement)
+    self.insert_infos = tuple(schema.columns[k] for k in self.insert_cols)
+    self.insert_encoders = tuple(
+        self.encoders[self.columns.index(k)] for k in self.insert_cols)
+    self.map_row = _compile_row_mapper(
+        self.insert_cols, self.insert_infos, self.insert_encoders)
+    self.map_update_row = _compile_row_mapper(
+        self.insert_cols, self.insert_infos, self.insert_encoders,
+        generate_keys=False)
+    self.update_cols = tuple(
+        k for k in self.insert_cols if not schema.columns[k].primary_key)
+    self.update_indexes = tuple(
+        self.insert_cols.index(k) for k in self.update_cols)
+    self.autoincrement_key = None
+    if len(schema.primary_key) == 1 \
+            and schema.columns[schema.primary_key[0]].autoincrement:
+      self.autoincrement_key = schema.primary_key[0]
+
+    self.pk_encoders = tuple(
+        self.encoders[self.columns.index(k)] for k in self.primary_key)
+    self.pk_decoders = tuple(
+        self.decoders[self.columns.index(k)] for k in self.primary_key)
+    self._plain_key = all(enc is None for enc in self.pk_encoders)
+    self._get_key = None
+    if len(self.primary_key) > 1:
+      self._get_key = itemgetter(*self.primary_key)
+    # Unless the key is autoincremented, the mapped values already hold the
+    # encoded key, and the UPDATE parameters are picked from them in one call
+    self._pick_update_params = None
+    if self.autoincrement_key is None \
+            and len(self.update_cols) + len(self.primary_key) > 1:
+      self._pick_update_params = itemgetter(*(
+          self.update_indexes
+          + tuple(self.insert_cols.index(k) for k in self.primary_key)))
+    self.pk_where_sql = _AND.join(['%s = ?' % k for k in self.primary_key])
+    self.pk_order_sql = ', '.join(self.primary_key)
+    # Keyset pagination needs a key to order by
+    self.pk_after_sql = None
+    if len(self.primary_key) > 1:
+      self.pk_after_sql = '(%s) > (%s)' % (
+          self.pk_order_sql, ', '.join(['?' for k in self.primary_key]))
+    elif len(self.primary_key) == 1:
+      self.pk_after_sql = '%s > ?' % self.primary_key[0]
+    # Only composite and autoincrement keys are declared as PRIMARY KEY,
+    # which makes them unique and indexed; blobs have no cursor encoding
+    self.keyset = not self.pk_after_sql is None \
+        and (len(self.primary_key) > 1 or not self.autoincrement_key is None) \
+        and not any(isinstance(schema.columns[k].column_type, Blob)
+                    for k in self.primary_key)
+    self.insert_sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        schema.name,
+        ','.join(self.insert_cols),
+        ','.join(['?' for k in self.insert_cols]),
+    )
+    self.update_sql = 'UPDATE %s SET %s WHERE %s' % (
+        schema.name,
+        ', '.join(['%s = ?' % k for k in self.update_cols]),
+        self.pk_where_sql,
+    )
+    self.delete_sql = 'DELETE FROM %s WHERE %s' % (
+        schema.name, self.pk_where_sql)
+    self.select_all_sql = 'SELECT %s FROM %s' % (
+        ', '.join(self.columns), schema.name)
+    self.find_by_key_sql = '%s WHERE %s LIMIT 1' % (
+        self.select_all_sql, self.pk_where_sql)
+    self.count_sql = 'SELECT COUNT(*) FROM %s' % schema.name
+    self.exists_sql = 'SELECT 1 FROM %s' % schema.name
+
+    self.fts_table = '%s%s' % (fts_table_prefix, schema.name)
+    analyzed = tuple(k for k, v in schema.columns.items()
+                     if not v.analyze is None)
+    # External content indexes reference their rows by rowid and only hold
+    # the analyzed columns; the others also store the primary key.
+    self.fts_rowid = _fts_rowid_column(schema) if analyzed else None
+    if not self.fts_rowid is None:
+      self.fts_columns = analyzed
+      self.fts_key_sql = 'rowid'
+      self.fts_join_sql = 'a.rowid = b.%s' % self.fts_rowid
+    else:
+      self.fts_columns = self.primary_key + analyzed if analyzed else ()
+      self.fts_key_sql = self.pk_order_sql
+      self.fts_join_sql = _AND.join(['a.%s = b.%s' % (k, k)
+                                     for k in self.primary_key])
+    self.fts_select_sql = 'SELECT %s' % ', '.join(
+        ['b.%s' % k for k in self.columns])
+
+  def reader_for(self, names):
+    # Row reader for a result whose columns are `names`, in any order. The
+    # common `SELECT *` shape uses `from_row`; other shapes get a reader of
+    # their own, with missing columns set to None and unknown ones ignored.
+    if names == self.columns:
+      return self.from_row
+
+    reader = self._readers.get(names)
+    if reader is None:
+      known = tuple(k if k in self.columns else None for k in names)
+      indexes = [None if k is None else self.columns.index(k) for k in known]
+      reader = self._readers[names] = compile_row_reader(
+          self.t, known,
+          [None if i is None else self.decoders[i] for i in indexes],
+          nullable=[True if i is None else self.column_infos[i].nullable
+                    for i in indexes],
+          missing=tuple(k for k in self.columns if not k in known))
+    return reader
+
+  def where_template(self, keys: tuple, alias=None, partition_keys=()):
+    # `(sql, encoders)` of the equality filter on `keys` followed by
+    # `partition_keys`, or None when `keys` holds an operator. Only the
+    # values are left to encode per call.
+    cache_key = (keys, alias, partition_keys)
+    try:
+      return self._where_templates[cache_key]
+    except KeyError:
+      pass
+
+    template = None
+    if not any(k[0] == '$' for k in keys):
+      names = keys + partition_keys
+      encoders = tuple(self.column_encoders[k] for k in names)
+      sql = _AND.join(['%s = ?' % k if alias is None
+                       else '%s.%s = ?' % (alias, k) for k in names])
+      template = (sql, encoders)
+
+    if len(self._where_templates) >= self.__class__.MAX_WHERE_TEMPLATES:
+      self._where_templates.clear()
+    self._where_templates[cache_key] = template
+    return template
+
+  def update_params(self, model, values):
+    # Parameters of `update_sql` from the `map_update_row` values of `model`
+    if not self._pick_update_params is None:
+      return self._pick_update_params(values)
+    return tuple([values[i] for i in self.update_indexes]
+                 + self.encode_model_key(model))
+
+  def encode_key(self, key):
+    # Parameters of `pk_where_sql` for `key`, a value or, for composite keys,
+    # a dict of values
+    values = (key,) if self._get_key is None else self._get_key(key)
+    if self._plain_key:
+      return list(values)
+    return self._encode_key_values(values)
+
+  def encode_model_key(self, model):
+    return self._encode_key_values(
+        [getattr(model, attr_name) for attr_name in self.primary_key])
+
+  def _encode_key_values(self, values):
+    return [(enc(v) if not enc is None and not v is None else v)
+            for v, enc in zip(values, self.pk_encoders)]
+
+
+class ReadOnlyPool(object):
+  class ExhaustedError(Exception):
+    def __init__(self, size, timeout):
+      super().__init__(
+          'No read-only connection was released within %ss (pool size: %d)'
+          % (timeout, size))
+
+  def __init__(self, db_file: str, size: int, pragmas: dict = None, cached_statements=128):
+    if size < 1:
+      raise ValueError('`size` must be greater than 0')
+
+    self._db_file = db_file
+    self._size = size
+    self._pragmas = pragmas or {}
+    self._cached_statements = cached_statements
+    self._connections = None
+    self._lock = threading.Lock()
+
+  def open(self):
+    if not self._connections is None:
+      raise Driver.AlreadyConnectedError()
+
+    uri = 'file:%s?mode=ro' % pathname2url(os.path.abspath(self._db_file))
+    self._connections = queue.Queue(maxsize=self._size)
+    con = None
+    for i in range(self._size):
+      con = sqlite3.connect(
+          uri,
+          uri=True,
+          isolation_level=None,
+          check_same_thread=False,
+          cached_statements=self._cached_statements,
+      )
+      for name, value in self._pragmas.items():
+        con.execute('PRAGMA %s = %s' % (name, value))
+      self._connections.put(con)
+
+  # Waits up to `timeout` seconds for a free connection (0 does not wait,
+  # None waits forever) and raises ExhaustedError otherwise.
+  def get(self, timeout=None):
+    connections = self._connections
+    if connections is None:
+      raise Driver.InvalidConnectionStateError(
+          expected='open', actual='closed')
+
+    try:
+      return connections.get(timeout=timeout)
+    except queue.Empty:
+      raise ReadOnlyPool.ExhaustedError(self._size, timeout)
+
+  def put(self, con):
+    with self._lock:
+      if self._connections is None:
+        # The pool was closed while `con` was checked out
+        con.close()
+      else:
+        self._connections.put(con)
 
+  @contextmanager
+  def acquire(self, timeout=None):
+    con = self.get(timeout)
+    try:
+      yield con
+    finally:
+      self.put(con)
+
+  # Closes the idle connections right away; the ones still checked out, e.g.
+  # by an unfinished `stream=True` generator, are closed when handed back.
+  def close(self):
+    with self._lock:
+      connections = self._connections
+      if connections is None:
+        raise Driver.InvalidConnectionStateError(
+            expected='open', actual='closed')
+      self._connections = None
 
-def _or(*criterias):
-  result = ' OR '.join(criterias)
-  if len(criterias) > 1:
-    result = '(' + result + ')'
-  return result
+    while True:
+      try:
+        connections.get_nowait().close()
+      except queue.Empty:
+        break
 
 
 class SqliteDriver(Driver):
   FTS_TABLE_PREFIX = 'fts5__'
-
-  def __init__(self, db_file=':memory:'):
+  FETCH_SIZE = 500
+  TRANSACTION_MODES = {
+      'deferred': 'DEFERRED',
+      'immediate': 'IMMEDIATE',
+      'exclusive': 'EXCLUSIVE',
+  }
+  # Applied on every `connect`. `journal_mode=WAL` lets readers proceed while
+  # a writer is active but keeps `<db_file>-wal` and `<db_file>-shm` sidecar
+  # files next to the database. The `pragmas` option overrides single
+  # entries; a value of None drops the pragma. FILE_PRAGMAS only apply to
+  # on-disk databases.
+  DEFAULT_PRAGMAS = {
+      'journal_mode': 'WAL',
+      'synchronous': 'NORMAL',
+      'busy_timeout': 5000,
+      'cache_size': -64000,
+      'temp_store': 'MEMORY',
+      'foreign_keys': 'ON',
+      'mmap_size': 268435456,
+  }
+  FILE_PRAGMAS = ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size')
+
+  # Reads issued outside of a transaction are served by a pool of
+  # `read_pool_size` read-only connections while `_con` remains the single
+  # writer. `read_pool_size=0` disables the pool and runs every statement on
+  # the writer, which can be faster for single-threaded use. In-memory
+  # databases cannot be shared between connections, so they never use the
+  # pool. Threads other than the connecting one wait up to
+  # `read_pool_timeout` seconds for a free reader before raising
+  # `ReadOnlyPool.ExhaustedError`. `result_cache_size` enables the `search` result
+  # cache for offset pages; it is off by default because writes from other
+  # processes cannot invalidate it.
+  def __init__(self, db_file=':memory:', pragmas: dict = None, read_pool_size=4,
+               read_pool_timeout=5.0, result_cache_size=0, result_cache_ttl=None,
+               cached_statements=256):
     self._con = None
+    self._cursor = None
+    if result_cache_size > 0:
+      self._result_cache = ResultCache(result_cache_size, result_cache_ttl)
     self._db_file = db_file
+    self._pragmas = dict(self.__class__.DEFAULT_PRAGMAS)
+    self._pragmas.update(pragmas or {})
+    self._read_pool_size = read_pool_size
+    self._read_pool_timeout = read_pool_timeout
+    self._cached_statements = cached_statements
+    self._read_pool = None
+    self._writer_thread = None
     self._in_transaction = False
+    self._in_savepoint = False
+    self._written_tables = set()
+    self._plans = {}
 
   def connect(self):
     if not self._con is None:
@@ -39,51 +447,146 @@ class SqliteDriver(Driver):
     self._con = sqlite3.connect(
         self._db_file,
         isolation_level=None,
+        cached_statements=self._cached_statements,
     )
+    # Shared by the write paths, which never leave rows pending on it. Reads
+    # use a cursor of their own since they may be consumed lazily.
+    self._cursor = self._con.cursor()
+    self._writer_thread = threading.get_ident()
+    self._apply_pragmas()
+
+    if self._read_pool_size > 0 and not self._in_memory():
+      self._read_pool = ReadOnlyPool(
+          self._db_file,
+          self._read_pool_size,
+          cached_statements=self._cached_statements,
+          pragmas={k: v for k, v in self._pragmas.items()
+                   if k != 'journal_mode' and not v is None}
+      )
+      self._read_pool.open()
+
+  def _in_memory(self):
+    return self._db_file in (':memory:', '')
+
+  def _apply_pragmas(self):
+    in_memory = self._in_memory()
+    for name, value in self._pragmas.items():
+      if value is None or (in_memory and name in self.__class__.FILE_PRAGMAS):
+        continue
+      self._execute('PRAGMA %s = %s' % (name, value))
 
   def close(self):
     if self._con is None:
       raise Driver.InvalidConnectionStateError(
           expected='open', actual='closed')
 
+    self._close_read_pool()
     self._con.close()
 
-  def begin_transaction(self):
-    if not self._in_transaction:
-      self._execute('BEGIN TRANSACTION')
-      self._in_transaction = True
+  def _close_read_pool(self):
+    if not self._read_pool is None:
+      self._read_pool.close()
+      self._read_pool = None
+
+  @contextmanager
+  def _acquire_reader(self):
+    # Reads of the connecting thread inside a transaction must see its
+    # uncommitted writes, so they stay on the writer connection. Other threads
+    # cannot use the writer and read the committed data from the pool.
+    own_thread = threading.get_ident() == self._writer_thread
+    if self._read_pool is None or (own_thread and self._con.in_transaction):
+      yield self._con
       return
-    raise Driver.AlreadyInTransactionError()
+
+    # The readers may all be held by open `stream=True` generators of the
+    # connecting thread itself, so it falls back to the writer rather than
+    # wait. Other threads wait for a reader.
+    pool = self._read_pool
+    try:
+      con = pool.get(0 if own_thread else self._read_pool_timeout)
+    except ReadOnlyPool.ExhaustedError:
+      if not own_thread:
+        raise
+      con = None
+
+    if con is None:
+      yield self._con
+      return
+    try:
+      yield con
+    finally:
+      pool.put(con)
+
+  # Write transactions default to IMMEDIATE so the RESERVED lock is taken
+  # upfront; a DEFERRED transaction upgrading its lock on the first write
+  # fails with SQLITE_BUSY when another writer got there first. Use
+  # `mode='deferred'` for transactions that only read.
+  def begin_transaction(self, mode='immediate'):
+    if not mode in self.__class__.TRANSACTION_MODES:
+      raise ValueError('`mode`: invalid transaction mode: `%s`' % mode)
+
+    if self._in_transaction:
+      raise Driver.AlreadyInTransactionError()
+
+    # A transaction opened on the connection outside the driver (e.g. a
+    # SAVEPOINT) cannot be joined with BEGIN, so ours nests in a savepoint
+    if self._con.in_transaction:
+      self._execute('SAVEPOINT minidb')
+      self._in_savepoint = True
+    else:
+      self._execute('BEGIN %s' % self.__class__.TRANSACTION_MODES[mode])
+    self._in_transaction = True
 
   def commit(self):
     if self._in_transaction:
-      self._con.commit()
+      if self._in_savepoint:
+        self._execute('RELEASE minidb')
+        self._in_savepoint = False
+      else:
+        self._con.commit()
       self._in_transaction = False
+      # Other threads may have cached the committed data of the written
+      # tables while the transaction was open
+      written_tables, self._written_tables = self._written_tables, set()
+      for table_name in written_tables:
+        super()._invalidate_results(table_name)
       return
     raise Driver.NotInTransactionError()
 
   def rollback(self):
     if self._in_transaction:
-      self._con.rollback()
+      if self._in_savepoint:
+        self._execute('ROLLBACK TO minidb')
+        self._execute('RELEASE minidb')
+        self._in_savepoint = False
+      else:
+        self._con.rollback()
       self._in_transaction = False
+      self._written_tables.clear()
+      if not self._result_cache is None:
+        self._result_cache.clear()
       return
     raise Driver.NotInTransactionError()
 
+  @contextmanager
+  def atomic(self):
+    # Runs the block in a single transaction, committed when it completes
+    # and rolled back when it raises. Inside an open transaction the block
+    # simply joins it.
+    if self._in_transaction:
+      yield
+      return
+
+    self.begin_transaction()
+    try:
+      yield
+      self.commit()
+    except:
+      self.rollback()
+      raise
+
   def create_table(self, name: str, metadata: TableMetadata):
-    _log.info('Creating table `%s`' % name)
-
-    def _typename_sql(t):
-      if isinstance(t, Integer) or isinstance(t, Bit):
-        return "INTEGER"
-      if isinstance(t, Float):
-        return "REAL"
-      if isinstance(t, String):
-        return "TEXT"
-      if isinstance(t, Date):
-        return "INTEGER"
-      if isinstance(t, Blob):
-        return "BLOB"
-      raise NotImplementedError()
+    _log.info('Creating table `%s`', name)
 
     def _column_sql(name: str, c: Column):
       typename_sql = _typename_sql(c.column_type)
@@ -124,53 +627,89 @@ class SqliteDriver(Driver):
                         c in metadata.columns.items() if not c.analyze is None]
     if len(analyzed_columns) > 0:
       index_table_name = "%s%s" % (self.__class__.FTS_TABLE_PREFIX, name)
-      index_column_names = primary_key_names + analyzed_columns
-
-      self._execute(
-          'CREATE VIRTUAL TABLE %s USING fts5(%s)'
-          % (index_table_name, ', '.join(index_column_names))
-      )
+      rowid_column = _fts_rowid_column(metadata)
 
       def _trigger(table_name, event_name, sql):
         return 'CREATE TRIGGER %s__%s AFTER %s ON %s BEGIN\n%s\nEND;' \
             % (table_name, event_name.lower(), event_name.upper(), table_name, sql)
 
-      self._executescript(_trigger(
-          table_name=metadata.name,
-          event_name="INSERT",
-          sql="INSERT INTO %s (%s) VALUES (%s);" % (
-              index_table_name,
-              ', '.join(index_column_names),
-              ', '.join(
-                  ['new.%s' % col_name for col_name in index_column_names]),
-          )
-      ))
-      self._executescript(_trigger(
-          table_name=metadata.name,
-          event_name="DELETE",
-          sql="INSERT INTO %s (%s, %s) VALUES ('delete', %s);" % (
-              index_table_name,
-              index_table_name,
-              ', '.join(index_column_names),
-              ', '.join(
-                  ['old.%s' % col_name for col_name in index_column_names]),
-          )
-      ))
-      self._executescript(_trigger(
-          table_name=metadata.name,
-          event_name="UPDATE",
-          sql="INSERT INTO %s (%s, %s) VALUES ('delete', %s);" % (
-              index_table_name,
-              index_table_name,
-              ', '.join(index_column_names),
-              ', '.join(
-                  ['old.%s' % col_name for col_name in index_column_names]),
-          ) + "INSERT INTO %s (%s) VALUES (%s);" % (
-              index_table_name,
-              ', '.join(index_column_names),
-              ', '.join(
-                  ['new.%s' % col_name for col_name in index_column_names]),
-          )
+      if not rowid_column is None:
+        # External content table: FTS5 keeps only the index and reads the
+        # analyzed values from `name` through its INTEGER PRIMARY KEY
+        index_column_names = ['rowid'] + analyzed_columns
+        self._execute(
+            "CREATE VIRTUAL TABLE %s USING fts5(%s, content='%s', content_rowid='%s')"
+            % (index_table_name, ', '.join(analyzed_columns), name, rowid_column)
+        )
+
+        def _values(prefix):
+          return ', '.join(['%s.%s' % (prefix, rowid_column)] + [
+              '%s.%s' % (prefix, col_name) for col_name in analyzed_columns])
+
+        delete_sql = "INSERT INTO %s (%s, %s) VALUES ('delete', %s);" % (
+            index_table_name,
+            index_table_name,
+            ', '.join(index_column_names),
+            _values('old'),
+        )
+      else:
+        index_column_names = primary_key_names + analyzed_columns
+        self._execute(
+            'CREATE VIRTUAL TABLE %s USING fts5(%s)'
+            % (index_table_name, ', '.join(index_column_names))
+        )
+
+        def _values(prefix):
+          return ', '.join(['%s.%s' % (prefix, col_name)
+                            for col_name in index_column_names])
+
+        # The `'delete'` command is only available to external content
+        # tables, so the stale entry is deleted by key. FTS5 has no index on
+        # its columns, so this is a full scan of the index table: every
+        # UPDATE and DELETE on `name` costs O(rows). Models that update or
+        # delete often should use an autoincrement Integer key, which gets
+        # the external content index above.
+        delete_sql = "DELETE FROM %s WHERE %s;" % (
+            index_table_name,
+            _AND.join(['%s = old.%s' % (k, k) for k in primary_key_names]),
+        )
+
+      insert_sql = "INSERT INTO %s (%s) VALUES (%s);" % (
+          index_table_name,
+          ', '.join(index_column_names),
+          _values('new'),
+      )
+
+      # One script, so the three triggers are sent to SQLite in one call
+      self._executescript('\n'.join([
+          _trigger(metadata.name, "INSERT", insert_sql),
+          _trigger(metadata.name, "DELETE", delete_sql),
+          _trigger(metadata.name, "UPDATE", delete_sql + insert_sql),
+      ]))
+
+  # Repopulates the full-text index of `t` from its table in one
+  # `INSERT ... SELECT`. For large initial loads it is cheaper to drop the
+  # table triggers, bulk insert, call this and recreate the triggers than to
+  # index row by row. It is also the cheaper path for bulk updates and deletes
+  # on tables without an autoincrement key, whose triggers scan the whole
+  # index for every row (see `create_table`).
+  def rebuild_fts(self, t: type):
+    plan = self._get_plan(t)
+    if len(plan.fts_columns) == 0:
+      raise ValueError('`t`: `%s` has no analyzed columns' % t.__table__.name)
+
+    if not plan.fts_rowid is None:
+      self._execute("INSERT INTO %s (%s) VALUES ('rebuild')" % (
+          plan.fts_table, plan.fts_table))
+      return
+
+    with self.atomic():
+      self._execute('DELETE FROM %s' % plan.fts_table)
+      self._execute('INSERT INTO %s (%s) SELECT %s FROM %s' % (
+          plan.fts_table,
+          ', '.join(plan.fts_columns),
+          ', '.join(plan.fts_columns),
+          t.__table__.name,
       ))
 
   def add(self, t: type, model):
@@ -178,207 +717,334 @@ class SqliteDriver(Driver):
     if model is None:
       raise ValueError('`model` cannot be None')
 
+    plan = self._get_plan(t)
+    sql_params, errors = plan.map_row(model)
+    if len(errors) > 0:
+      raise Driver.DataValidationError(schema.name, errors)
+
+    c = self._cursor
+    self._execute(plan.insert_sql, sql_params, cursor=c)
+    self._invalidate_results(schema.name)
+
+    if not plan.autoincrement_key is None:
+      setattr(model, plan.autoincrement_key, c.lastrowid)
+
+  def add_many(self, t: type, models, chunk_size=500, fetch_keys=True):
+    # `models` may be any iterable; parameters are produced lazily while
+    # `executemany` consumes them, one call per `chunk_size` models. Invalid
+    # models are skipped and reported together once the batch has been
+    # consumed, at which point the transaction is rolled back (or left to the
+    # caller when joining an open one).
+    # Tables with an autoincrement primary key fall back to one `INSERT` per
+    # model unless `fetch_keys` is False, since `lastrowid` is only reliable
+    # for single-row statements.
+    if models is None:
+      raise ValueError('`models` cannot be None')
+    if chunk_size < 1:
+      raise ValueError('`chunk_size` must be greater than 0')
+
+    plan = self._get_plan(t)
+    with self.atomic():
+      if not plan.autoincrement_key is None and fetch_keys:
+        self._add_each(t, models)
+      else:
+        self._add_many(t, models, chunk_size)
+
+  def _add_each(self, t: type, models):
+    schema: TableMetadata = t.__table__
+    plan = self._get_plan(t)
     errors = []
-    row = {}
-    self._map_row(model, schema, row, errors)
+    c = self._cursor
+    for i, model in enumerate(models):
+      if model is None:
+        raise ValueError('`models` cannot contain None')
+      sql_params, model_errors = plan.map_row(model)
+      if len(model_errors) > 0:
+        errors.extend(['[%d] %s' % (i, e) for e in model_errors])
+        continue
+      self._execute(plan.insert_sql, sql_params, cursor=c)
+      setattr(model, plan.autoincrement_key, c.lastrowid)
+    self._invalidate_results(schema.name)
+
     if len(errors) > 0:
       raise Driver.DataValidationError(schema.name, errors)
 
-    col_names = row.keys()
-    col_values = [row[n] for n in col_names]
-    c = self._con.cursor()
-    self._execute(
-        "INSERT INTO %s (%s) VALUES (%s)"
-        % (
-            schema.name,
-            ",".join(col_names),
-            ",".join(["?" for n in col_names]),
-        ),
-        col_values,
-        cursor=c
-    )
+  def _add_many(self, t: type, models, chunk_size):
+    schema: TableMetadata = t.__table__
+    plan = self._get_plan(t)
+    errors = []
 
-    has_autoincrement_pkey = len(
-        schema.primary_key) == 1 and schema.columns[schema.primary_key[0]].autoincrement
-    if has_autoincrement_pkey:
-      setattr(model, schema.primary_key[0], c.lastrowid)
+    def _rows():
+      values = model_errors = None
+      for i, model in enumerate(models):
+        if model is None:
+          raise ValueError('`models` cannot contain None')
+        values, model_errors = plan.map_row(model)
+        if len(model_errors) > 0:
+          errors.extend(['[%d] %s' % (i, e) for e in model_errors])
+          continue
+        yield values
+
+    rows = _rows()
+    chunk = list(islice(rows, chunk_size))
+    while chunk:
+      self._executemany(plan.insert_sql, chunk)
+      chunk = list(islice(rows, chunk_size))
+    self._invalidate_results(schema.name)
+
+    if len(errors) > 0:
+      raise Driver.DataValidationError(schema.name, errors)
 
   def update(self, t: type, model):
     schema: TableMetadata = t.__table__
     if model is None:
       raise ValueError('`model` cannot be None')
-    if len(schema.primary_key) > 1:
-      criteria = {attr_name: getattr(model, attr_name)
-                  for attr_name in schema.primary_key}
-    else:
-      criteria = {schema.primary_key[0]: getattr(
-          model, schema.primary_key[0])}
 
-    errors = []
-    row = {}
-    self._map_row(model, schema, row, errors)
+    plan = self._get_plan(t)
+    values, errors = plan.map_update_row(model)
     if len(errors) > 0:
       raise Driver.DataValidationError(schema.name, errors)
 
-    col_names = [attr_name for attr_name in row.keys(
-    ) if not schema.columns[attr_name].primary_key]
-    sql_params = [row[n] for n in col_names]
-    set_sql = ', '.join(['%s = ?' % cn for cn in col_names])
-    criteria_sql = self._format_criteria(criteria, sql_params, schema)
-    c = self._con.cursor()
-    self._execute(
-        "UPDATE %s SET %s WHERE %s"
-        % (
-            schema.name,
-            set_sql,
-            criteria_sql,
-        ),
-        sql_params,
-        cursor=c
-    )
+    sql_params = plan.update_params(model, values)
+    c = self._cursor
+    self._execute(plan.update_sql, sql_params, cursor=c)
+    self._invalidate_results(schema.name)
     if c.rowcount == 0:
       raise Driver.UnaffectedRowsError()
 
+  def update_many(self, t: type, models):
+    # Every column is written back for every model, so all rows share a
+    # single statement. Fails without writing anything if any of the models
+    # does not match an existing row.
+    schema: TableMetadata = t.__table__
+    if models is None:
+      raise ValueError('`models` cannot be None')
+
+    plan = self._get_plan(t)
+    errors = []
+    rows = []
+    values = model_errors = None
+    for i, model in enumerate(models):
+      if model is None:
+        raise ValueError('`models` cannot contain None')
+      values, model_errors = plan.map_update_row(model)
+      if len(model_errors) > 0:
+        errors.extend(['[%d] %s' % (i, e) for e in model_errors])
+        continue
+      rows.append(plan.update_params(model, values))
+    if len(errors) > 0:
+      raise Driver.DataValidationError(schema.name, errors)
+
+    with self.atomic():
+      c = self._cursor
+      self._executemany(plan.update_sql, rows, cursor=c)
+      self._invalidate_results(schema.name)
+      if c.rowcount < len(rows):
+        raise Driver.UnaffectedRowsError()
+
   def count(self, t: type, criteria=None, partition_key=None, term=None):
     if not term is None:
       return self._count_ft(t, term, criteria, partition_key)
 
-    schema: TableMetadata = t.__table__
+    plan = self._get_plan(t)
 
     sql_params = []
 
-    criteria_sql = 'WHERE ' + self._format_criteria(
-        criteria, sql_params, schema, partition_key) if not criteria is None or not partition_key is None else ''
-    sql = 'SELECT COUNT(*) FROM %s %s' % (
-        schema.name, criteria_sql
-    )
+    sql = plan.count_sql
+    if not criteria is None or not partition_key is None:
+      sql += ' WHERE ' + self._format_criteria(
+          criteria, sql_params, plan, partition_key)
 
-    for (count,) in self._execute(sql, sql_params):
+    for (count,) in self._execute(sql, sql_params, readonly=True):
       return count
 
-  def _count_ft(self, t: type, term, criteria=None, partition_key=None):
-    schema: TableMetadata = t.__table__
-    analyzed_columns = [col_name for col_name,
-                        c in schema.columns.items() if c.analyze]
-    sql_params = []
-
-    where_sql = [
-      "%s%s MATCH '%s'" % (self.__class__.FTS_TABLE_PREFIX, schema.name, term)
-    ]
+  def exists(self, t: type, criteria=None, partition_key=None):
+    plan = self._get_plan(t)
 
-    join_on_sql = [
-        _and(*["a.%s = b.%s" % (col_name, col_name)
-               for col_name in schema.primary_key])
-    ]
+    sql_params = []
 
-    if not criteria is None:
-      join_on_sql.append(self._format_criteria(
-          criteria, sql_params, schema, partition_key=partition_key, alias="b"))
+    sql = plan.exists_sql
+    if not criteria is None or not partition_key is None:
+      sql += ' WHERE ' + self._format_criteria(
+          criteria, sql_params, plan, partition_key)
+    sql += ' LIMIT 1'
 
-    if not partition_key is None:
-      where_sql.insert(0, self._format_key(
-          vars(partition_key), sql_params, schema, prefix='a'))
+    return len(self._execute(sql, sql_params, readonly=True)) > 0
 
-    sql = "SELECT COUNT(*) " \
-        + "FROM %s%s a " % (self.__class__.FTS_TABLE_PREFIX, schema.name) \
-        + "INNER JOIN %s b ON %s " % (schema.name, _and(*join_on_sql)) \
-        + "WHERE %s " % _and(*where_sql)
+  def _count_ft(self, t: type, term, criteria=None, partition_key=None):
+    sql_params = []
+    sql = self._format_ft_query(
+        t, 'SELECT COUNT(*)', term, criteria, partition_key, sql_params)
 
-    for (count,) in self._execute(sql, sql_params):
+    for (count,) in self._execute(sql, sql_params, readonly=True):
       return count
 
-  def _find_ft(self, t: type, term, criteria=None, sort=None, limit=None, offset=None, partition_key=None):
-    schema: TableMetadata = t.__table__
-    all_columns = [col_name for col_name in schema.columns]
+  def _find_ft(self, t: type, term, criteria=None, sort=None, limit=None, offset=None, partition_key=None, stream=False):
+    plan = self._get_plan(t)
     sql_params = []
+    sql = self._format_ft_query(
+        t, plan.fts_select_sql, term, criteria, partition_key, sql_params) \
+        + (' ORDER BY a.rank' if sort is None else ' ' + self._format_sort(sort, 'b')) \
+        + (' LIMIT ? OFFSET ?' if not limit is None else '')
+    if not limit is None:
+      sql_params.extend([limit, offset or 0])
+
+    models = self._iter_models(t, plan, sql, sql_params)
+    return models if stream else list(models)
+
+  def _format_ft_query(self, t: type, select_sql, term, criteria, partition_key, sql_params):
+    # Filters on the base table are applied to the hits of a CTE holding only
+    # the MATCH, so SQLite never mixes them into the FTS5 scan. Both shapes
+    # expose the hits as `a` (primary key columns and `rank`) and the base
+    # table as `b`.
+    schema: TableMetadata = t.__table__
+    plan = self._get_plan(t)
+    match_sql = '%s MATCH ?' % plan.fts_table
+    sql_params.append(term)
+
+    if criteria is None and partition_key is None:
+      return '%s FROM %s a INNER JOIN %s b ON %s WHERE %s' % (
+          select_sql, plan.fts_table, schema.name, plan.fts_join_sql, match_sql)
+
+    return 'WITH hits AS (SELECT %s, rank FROM %s WHERE %s) ' % (
+        plan.fts_key_sql, plan.fts_table, match_sql) \
+        + '%s FROM hits a INNER JOIN %s b ON %s WHERE %s' % (
+            select_sql,
+            schema.name,
+            plan.fts_join_sql,
+            self._format_criteria(
+                criteria, sql_params, plan, partition_key, alias='b'),
+        )
 
-    where_sql = [
-      "%s%s MATCH '%s'" % (self.__class__.FTS_TABLE_PREFIX, schema.name, term)
-    ]
-
-    join_on_sql = [
-        _and(*["a.%s = b.%s" % (col_name, col_name)
-               for col_name in schema.primary_key])
-    ]
-
-    if not criteria is None:
-      join_on_sql.append(self._format_criteria(
-          criteria, sql_params, schema, partition_key=partition_key, alias="b"))
-
-    if not partition_key is None:
-      where_sql.insert(0, self._format_key(
-          vars(partition_key), sql_params, schema, prefix='a'))
-
-    sql = "SELECT %s " % (', '.join(['b.%s' % col_name for col_name in all_columns])) \
-        + "FROM %s%s a " % (self.__class__.FTS_TABLE_PREFIX, schema.name) \
-        + "INNER JOIN %s b ON %s " % (schema.name, _and(*join_on_sql)) \
-        + "WHERE %s " % _and(*where_sql) \
-        + "ORDER BY %s " % ('a.rank' if sort is None else self._format_sort(sort, 'b')) \
-        + ("LIMIT %d OFFSET %d" % (limit, offset) if not limit is None else "")
-
-    result = []
-    for row in self._execute(sql, sql_params):
-      result.append(t(**{attr_name: self._decode(row[all_columns.index(
-          attr_name)], schema.columns[attr_name].column_type) for attr_name in all_columns}))
-
-    return result
-
-  def find(self, t: type, criteria=None, sort=None, limit=None, offset=None, partition_key=None, term=None):
+  # With `stream`, find and query return a generator yielding the models as
+  # rows are fetched instead of a list. It holds a connection until it is
+  # exhausted or closed.
+  def find(self, t: type, criteria=None, sort=None, limit=None, offset=None, partition_key=None, term=None, stream=False):
 
     if not term is None:
-      return self._find_ft(t, term, criteria, sort, limit, offset, partition_key)
+      return self._find_ft(t, term, criteria, sort, limit, offset, partition_key, stream)
 
-    schema: TableMetadata = t.__table__
+    plan = self._get_plan(t)
 
     sql_params = []
 
-    all_columns = list(schema.columns.keys())
-    result_map = all_columns
-    select_sql = ', '.join(all_columns)
-    where_sql = 'WHERE ' + self._format_criteria(
-        criteria, sql_params, schema, partition_key) if not criteria is None or not partition_key is None else ''
-    sort_sql = self._format_sort(sort) if not sort is None else ''
-    limit_sql = 'LIMIT %d OFFSET %d' % (
-        limit, offset or 0) if not limit is None else ''
-    sql = 'SELECT %s FROM %s %s %s %s' % (
-        select_sql, schema.name, where_sql, sort_sql, limit_sql)
-    result = []
-    for row in self._execute(sql, sql_params):
-      result.append(t(**{attr_name: self._decode(row[result_map.index(
-          attr_name)], schema.columns[attr_name].column_type) for attr_name in result_map}))
-
-    return result
+    sql = plan.select_all_sql
+    if not criteria is None or not partition_key is None:
+      sql += ' WHERE ' + self._format_criteria(
+          criteria, sql_params, plan, partition_key)
+    if not sort is None:
+      sql += ' ' + self._format_sort(sort)
+    if not limit is None:
+      sql += ' LIMIT ? OFFSET ?'
+      sql_params.extend([limit, offset or 0])
+
+    models = self._iter_models(t, plan, sql, sql_params)
+    return models if stream else list(models)
 
   def find_one(self, t: type, key):
-    schema: TableMetadata = t.__table__
-    if len(schema.primary_key) > 1:
-      criteria = {attr_name: key[attr_name]
-                  for attr_name in schema.primary_key}
-    else:
-      criteria = {schema.primary_key[0]: key}
+    plan = self._get_plan(t)
+    sql_params = plan.encode_key(key)
 
-    results = self.find(t, criteria)
-    for x in results:
-      return x
+    for row in self._execute(plan.find_by_key_sql, sql_params, readonly=True):
+      return plan.from_row(row)
 
-  def remove(self):
-    raise NotImplementedError()
+  def find_after(self, t: type, criteria=None, limit=None, after_key=None, partition_key=None):
+    plan = self._get_plan(t)
+    if plan.pk_after_sql is None:
+      raise ValueError('`t`: `%s` has no primary key' % t.__table__.name)
 
-  def query(self, t, sql, sql_params=None):
-    schema: TableMetadata = t.__table__
-    all_columns = [col_name for col_name in schema.columns]
-    result = []
-    for row in self._execute(sql, sql_params):
-      result.append(t(**{attr_name: self._decode(row[all_columns.index(
-          attr_name)], schema.columns[attr_name].column_type) for attr_name in all_columns}))
+    sql_params = []
+    where_sql_list = []
+    if not criteria is None or not partition_key is None:
+      where_sql_list.append(self._format_criteria(
+          criteria, sql_params, plan, partition_key))
+    if not after_key is None:
+      where_sql_list.append(plan.pk_after_sql)
+      sql_params.extend(plan.encode_key(after_key))
+
+    where_sql = 'WHERE ' + \
+        _AND.join(where_sql_list) if len(where_sql_list) > 0 else ''
+    limit_sql = ''
+    if not limit is None:
+      limit_sql = 'LIMIT ?'
+      sql_params.append(limit)
+    sql = '%s %s ORDER BY %s %s' % (
+        plan.select_all_sql, where_sql, plan.pk_order_sql, limit_sql)
+
+    return list(self._iter_models(t, plan, sql, sql_params))
+
+  def remove(self, t: type, key):
+    plan = self._get_plan(t)
+    self._execute(plan.delete_sql, plan.encode_key(key))
+    self._invalidate_results(t.__table__.name)
+
+  def remove_many(self, t: type, keys):
+    if keys is None:
+      raise ValueError('`keys` cannot be None')
+
+    plan = self._get_plan(t)
+    rows = [tuple(plan.encode_key(key)) for key in keys]
+    with self.atomic():
+      self._executemany(plan.delete_sql, rows)
+      self._invalidate_results(t.__table__.name)
+
+  def query(self, t, sql, sql_params=None, stream=False):
+    plan = self._get_plan(t)
+    models = self._iter_models(t, plan, sql, sql_params, by_name=True)
+    return models if stream else list(models)
+
+  def _iter_models(self, t: type, plan: _TablePlan, sql: str, sql_params, by_name=False):
+    # Rows are pulled from sqlite3 in FETCH_SIZE batches so consumers only ever
+    # hold one batch of raw tuples alongside the models built from them. The
+    # reader connection is held until the generator is exhausted or closed.
+    with self._acquire_reader() as con:
+      cursor = self._execute(sql, sql_params, cursor=con.cursor())
+      if cursor.description is None:
+        # The statement returns no result set, e.g. an UPDATE
+        return
+      from_row = plan.from_row
+      if by_name:
+        from_row = plan.reader_for(
+            tuple(d[0] for d in cursor.description))
+      rows = cursor.fetchmany(self.__class__.FETCH_SIZE)
+      while rows:
+        for row in rows:
+          yield from_row(row)
+        rows = cursor.fetchmany(self.__class__.FETCH_SIZE)
+
+  def _keyset_supported(self, t):
+    return self._get_plan(t).keyset
+
+  def _cursor_values(self, t, model):
+    return self._get_plan(t).encode_model_key(model)
+
+  def _cursor_key(self, t, values):
+    plan = self._get_plan(t)
+    try:
+      values = [v if dec is None or v is None else dec(v)
+                for v, dec in zip(values, plan.pk_decoders)]
+    except (TypeError, ValueError, OverflowError, OSError):
+      raise ValueError('"cursor" is invalid')
+    return super()._cursor_key(t, values)
+
+  # Called once the write statement has run, so reads started before it cannot
+  # cache their rows under the new version. Pooled readers only see the write
+  # once committed, so tables written in a transaction are tracked for
+  # `commit`.
+  def _invalidate_results(self, table_name):
+    if self._result_cache is None:
+      return
 
-    return result
+    super()._invalidate_results(table_name)
+    if self._con.in_transaction:
+      self._written_tables.add(table_name)
 
-  def _decode(self, value, column_type):
-    if not value is None:
-      if isinstance(column_type, Date):
-        return datetime.fromtimestamp(value)
-      return value
+  def _get_plan(self, t: type):
+    plan = self._plans.get(t)
+    if plan is None:
+      plan = self._plans[t] = _TablePlan(
+          t, self.__class__.FTS_TABLE_PREFIX)
+    return plan
 
   def _encode(self, value, column_type):
     if not value is None:
@@ -386,47 +1052,72 @@ class SqliteDriver(Driver):
         return value.timestamp()
       return value
 
-  def _execute(self, sql: str, sql_params: list = [], cursor=None):
+  def _execute(self, sql: str, sql_params: list = None, cursor=None, readonly=False):
+    # With `readonly`, the statement runs on a pooled reader which is handed
+    # back before returning, so the rows are fetched eagerly and returned as a
+    # list. Lazily consumed reads go through `_acquire_reader` instead.
+    if readonly and cursor is None:
+      with self._acquire_reader() as con:
+        return self._execute(sql, sql_params, cursor=con.cursor()).fetchall()
+
     target = self._con if cursor is None else cursor
-    begin_mtime = int(time.time() * 1000)
-    elapsed_mtime = None
-    error = None
-    try:
-      return target.execute(sql, sql_params)
-    except sqlite3.OperationalError as err:
-      error = err
-      raise
-    finally:
-      state_txt = 'completed' if error is None else 'failed'
-      log_fn = _log.debug if error is None else _log.error
-      elapsed_mtime = int(time.time() * 1000) - begin_mtime
-      log_fn('Sql statement %s:\nsql: %s\nduration_ms: %d' %
-             (state_txt, sql, elapsed_mtime))
+    if not sql_params:
+      return self._logged(sql, target.execute, sql)
+    return self._logged(sql, target.execute, sql, sql_params)
+
+  def _executemany(self, sql: str, seq_of_params, cursor=None):
+    target = self._con if cursor is None else cursor
+    return self._logged(sql, target.executemany, sql, seq_of_params)
 
   def _executescript(self, sql: str, cursor=None):
     target = self._con if cursor is None else cursor
-    begin_mtime = int(time.time() * 1000)
-    elapsed_mtime = None
+    return self._logged(sql, target.executescript, sql)
+
+  def _logged(self, sql: str, fn, *args):
+    # Statements are only timed and logged when DEBUG is enabled; otherwise
+    # only failures are logged.
+    if not _log.isEnabledFor(logging.DEBUG):
+      try:
+        return fn(*args)
+      except sqlite3.OperationalError:
+        _log.error('Sql statement failed:\nsql: %s', sql)
+        raise
+
+    begin_ns = time.perf_counter_ns()
     error = None
     try:
-      return target.executescript(sql)
+      return fn(*args)
     except sqlite3.OperationalError as err:
       error = err
       raise
     finally:
       state_txt = 'completed' if error is None else 'failed'
       log_fn = _log.debug if error is None else _log.error
-      elapsed_mtime = int(time.time() * 1000) - begin_mtime
-      log_fn('Sql statement %s:\nsql: %s\nduration_ms: %d' %
-             (state_txt, sql, elapsed_mtime))
+      log_fn('Sql statement %s:\nsql: %s\nduration_us: %d',
+             state_txt, sql, (time.perf_counter_ns() - begin_ns) // 1000)
 
-  def _format_criteria(self, criteria: dict, sql_params: list, schema: TableMetadata, partition_key=None, alias=None):
+  def _format_criteria(self, criteria: dict, sql_params: list, plan: _TablePlan, partition_key=None, alias=None):
     if not criteria is None:
       if not isinstance(criteria, dict):
         raise TypeError('`criteria` must be instance of `dict`')
       if len(criteria) == 0:
         raise ValueError('`criteria` cannot be empty')
 
+    # Equality filters are compiled once per shape; only their values are
+    # encoded here
+    values = () if criteria is None else tuple(criteria.values())
+    partition_values = vars(partition_key) if partition_key else {}
+    template = plan.where_template(
+        () if criteria is None else tuple(criteria),
+        alias,
+        tuple(partition_values))
+    if not template is None:
+      sql, encoders = template
+      for v, enc in zip(values + tuple(partition_values.values()), encoders):
+        sql_params.append(v if enc is None or v is None else enc(v))
+      return sql
+
+    schema: TableMetadata = plan.schema
     criteria_sql_list = []
     if not criteria is None:
       criteria_args = col_info = col_name = None
@@ -435,7 +1126,7 @@ class SqliteDriver(Driver):
         if k[0] == "$":
           op_name = k[1:]
           criteria_sql_list.append(self._format_operator(
-              op_name, criteria_args, sql_params))
+              op_name, criteria_args, sql_params, schema, alias))
           continue
 
         col_info = schema.columns.get(k)
@@ -447,11 +1138,7 @@ class SqliteDriver(Driver):
       criteria_sql_list.append(self._format_key(
           vars(partition_key), sql_params, schema, prefix=alias))
 
-    criteria_sql = ' AND '.join(criteria_sql_list)
-    if len(criteria_sql_list) > 1:
-      criteria_sql = '(%s)' % criteria_sql
-
-    return criteria_sql
+    return _AND.join(criteria_sql_list)
 
   def _format_key(self, values: dict, sql_params: list, schema: TableMetadata, prefix=None):
     criterias_sql = []
@@ -462,20 +1149,25 @@ class SqliteDriver(Driver):
       criterias_sql.append('%s = ?' % col_name)
       sql_params.append(self._encode(v, col_info.column_type))
 
-    result = ' AND '.join(criterias_sql)
-    if len(criterias_sql) > 1:
-      result = '(' + result + ')'
-    return result
-
-  def _format_operator(self, left, right, name, args, sql_params):
-    operators = {
-        'eq': lambda name, v: '',
-        'gt': lambda argv: argv[0]
-    }
-    if not name in operators:
+    return _AND.join(criterias_sql)
+
+  def _format_operator(self, name, args, sql_params, schema: TableMetadata, alias=None):
+    # `args` is `[column name, value]`
+    op_sql = _OPERATORS.get(name)
+    if op_sql is None:
       raise ValueError('`name`: invalid operator: `%s`' % name)
+    if len(args) != 2:
+      raise ValueError('`$%s`: expected a column name and a value' % name)
+
+    col_name, value = args
+    col_info = schema.columns.get(col_name)
+    if col_info is None:
+      raise ValueError('`$%s`: unknown column `%s`' % (name, col_name))
 
-    return operators[name](*args)
+    sql_params.append(self._encode(value, col_info.column_type))
+    if not alias is None:
+      col_name = '%s.%s' % (alias, col_name)
+    return '%s %s ?' % (col_name, op_sql)
 
   def _format_sort(self, criteria, prefix=None):
     if not isinstance(criteria, list):
@@ -484,51 +1176,11 @@ class SqliteDriver(Driver):
     if len(criteria) == 0:
       raise ValueError('`criteria` does not contain any item')
 
-    criterias_sql = []
     for c in criteria:
       if not isinstance(c, tuple):
         raise TypeError('`criteria` items must be instances of `tuple`')
 
-      if len(c) != 2:
-        raise ValueError('`criteria` items must contain exactly 2 values')
-
-      attr_name, sort_dir = c
-
-      if sort_dir != 'ASC' and sort_dir != 'DESC':
-        raise ValueError(
-            '`criteria` items sort direction must be either "ASC" or "DESC"')
-
-      if not prefix is None:
-        attr_name = prefix + '.' + attr_name
-
-      criterias_sql.append('%s %s' % (attr_name, sort_dir))
-
-    return 'ORDER BY ' + ', '.join(criterias_sql)
-
-  def _map_row(self, model, schema, row, errors):
-    attr_info: Column = None
-    attr_value = None
-    for attr_name in schema.columns:
-      attr_info = schema.columns[attr_name]
-
-      # Skip autoincrement columns
-      if attr_info.autoincrement:
-        continue
-
-      if attr_info.generator:
-        attr_value = attr_info.generator()
-        setattr(model, attr_name, attr_value)
-      else:
-        attr_value = getattr(model, attr_name)
-
-      if attr_value is None and not attr_info.nullable:
-        errors.append(
-            '`%s`: value is null but the column is marked as not nullable'
-            % attr_name
-        )
-        continue
-
-      row[attr_name] = self._encode(attr_value, attr_info.column_type)
+    return _sort_sql(tuple(criteria), prefix)
 
   def __enter__(self):
     self.connect()
@@ -538,5 +1190,6 @@ class SqliteDriver(Driver):
     if not tb is None and self._con.in_transaction:
       self._con.rollback()
 
+    self._close_read_pool()
     self._con.close()
     del self._con
@@ -3,6 +3,20 @@
 import os, glob
 from setuptools import setup, find_packages
 
+# The driver is compiled when Cython is available; the pure Python module
+# stays in the package and is used otherwise.
+try:
+  from Cython.Build import cythonize
+  # Annotations in the driver are informal (e.g. `dict` criteria may be None,
+  # `list` parameters may be tuples), so Cython must not enforce them
+  ext_modules = cythonize(
+      ['minidb/sqlite.py'],
+      language_level=3,
+      compiler_directives={'annotation_typing': False},
+  )
+except ImportError:
+  ext_modules = []
+
 setup(
     name='minidb',
     version='2.6.1',
@@ -13,6 +27,7 @@ setup(
     description='',
     long_description='',
     packages=find_packages(exclude=['test']),
+    ext_modules=ext_modules,
     include_package_data=True,
     platforms=['MacOS X', 'Posix'],
     test_suite='test',
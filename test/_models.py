@@ -0,0 +1,140 @@
+import json
+import os
+import minidb
+from datetime import datetime
+from uuid import uuid4
+from minidb.schema import Column, Bit, Date, Integer, String
+
+Model = minidb.get_model_builder()
+
+
+class TestDocumentWithAutoIncrementPkey(Model):
+  __tablename__ = 'TestDocumentWithAutoIncrementPkey'
+  id = Column(Integer(), autoincrement=True, primary_key=True)
+  name = Column(String(), nullable=False)
+
+
+class TestDocumentWithGeneratedAttribute(Model):
+  __tablename__ = 'TestDocumentWithGeneratedAttribute'
+  id = Column(Integer(), generator=lambda: 1234567890, primary_key=True)
+
+
+class TestDocumentWithGeneratedKey(Model):
+  __tablename__ = 'TestDocumentWithGeneratedKey'
+  id = Column(String(), generator=lambda: str(uuid4()), primary_key=True)
+  name = Column(String())
+
+
+class TestDocumentWithoutKey(Model):
+  __tablename__ = 'TestDocumentWithoutKey'
+  name = Column(String())
+
+
+class TestDocumentWithDate(Model):
+  __tablename__ = 'TestDocumentWithDate'
+  id = Column(Integer(), autoincrement=True, primary_key=True)
+  created_on = Column(Date())
+
+
+class TestDatabaseInitializer(Model):
+  __tablename__ = 'TestDatabaseInitializer'
+  id = Column(Integer(), primary_key=True)
+  name = Column(String())
+
+
+class TestDatabaseUpdate(Model):
+  __tablename__ = 'TestDatabaseUpdate'
+  id = Column(Integer(), primary_key=True)
+  name = Column(String())
+
+
+class TestAddMany(Model):
+  __tablename__ = 'TestAddMany'
+  id = Column(Integer(), primary_key=True)
+  name = Column(String())
+
+
+class TestFind(Model):
+  __tablename__ = 'TestFind'
+  client_id = Column(String(), primary_key=True)
+  id = Column(String(), primary_key=True)
+  first_name = Column(String())
+  last_name = Column(String())
+  email = Column(String())
+  state = Column(String())
+  locked = Column(Bit())
+  created_on = Column(Date())
+  updated_on = Column(Date())
+
+
+class TestFullText(Model):
+  __tablename__ = 'TestFullText'
+  client_id = Column(String(), primary_key=True)
+  id = Column(String(), primary_key=True)
+  title = Column(String(), analyze=True)
+  text = Column(String(), analyze=True)
+  published = Column(Bit())
+
+
+class TestFullTextRowid(Model):
+  __tablename__ = 'TestFullTextRowid'
+  id = Column(Integer(), autoincrement=True, primary_key=True)
+  client_id = Column(String())
+  title = Column(String(), analyze=True)
+
+
+def _load_test_data(file_name):
+  with open(os.path.join(os.path.dirname(__file__), file_name), 'rb') as fh:
+    return json.loads(fh.read())
+
+
+def _decode_dates(test_data, *attr_names):
+  # Epoch seconds to datetimes, in place since the parsed data is not shared
+  fromtimestamp = datetime.fromtimestamp
+  for td in test_data:
+    for attr_name in attr_names:
+      td[attr_name] = fromtimestamp(td[attr_name])
+  return test_data
+
+
+def _to_rows(t, test_data):
+  # Positional rows in table column order, as read by `t.from_row`
+  column_names = t.__table__.column_names
+  return tuple(tuple(td.get(k) for k in column_names) for td in test_data)
+
+
+@Model.database_initializer
+def _initialize_db(driver: minidb.Driver):
+  with driver.atomic():
+    driver.add(
+        TestDatabaseInitializer,
+        TestDatabaseInitializer(
+            id=9999,
+            name='created by database initializer'
+        )
+    )
+
+    driver.add(
+        TestDatabaseUpdate,
+        TestDatabaseUpdate(
+            id=9999,
+            name='created by database initializer'
+        )
+    )
+
+    # One executemany per table
+    driver.add_many(
+        TestFind, [TestFind.from_row(row) for row in _FIND_ROWS],
+        chunk_size=len(_FIND_ROWS))
+    driver.add_many(
+        TestFullText, [TestFullText.from_row(row) for row in _FULLTEXT_ROWS],
+        chunk_size=len(_FULLTEXT_ROWS))
+
+
+Model.build()
+
+# Seed data is parsed once per run, with dates already decoded
+_FIND_ROWS = _to_rows(TestFind, _decode_dates(
+    _load_test_data('find_test_data.json'), 'created_on', 'updated_on'))
+_FULLTEXT_ROWS = _to_rows(
+    TestFullText, _load_test_data('fulltext_test_data.json'))
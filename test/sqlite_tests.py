@@ -1,116 +1,72 @@
 import logging
-import json
 import os
+import sqlite3
+import tempfile
+import threading
 import unittest
 import minidb
 from datetime import datetime
-from minidb.schema import Column, Bit, Date, Integer, String
+from operator import attrgetter
 from minidb.driver import PartitionKey
-
-Model = minidb.get_model_builder()
-
-
-class TestDocumentWithAutoIncrementPkey(Model):
-  __tablename__ = 'TestDocumentWithAutoIncrementPkey'
-  id = Column(Integer(), autoincrement=True, primary_key=True)
-  name = Column(String(), nullable=False)
-
-
-class TestDocumentWithGeneratedAttribute(Model):
-  __tablename__ = 'TestDocumentWithGeneratedAttribute'
-  id = Column(Integer(), generator=lambda: 1234567890, primary_key=True)
-
-
-class TestDocumentWithDate(Model):
-  __tablename__ = 'TestDocumentWithDate'
-  id = Column(Integer(), autoincrement=True, primary_key=True)
-  created_on = Column(Date())
-
-
-class TestDatabaseInitializer(Model):
-  __tablename__ = 'TestDatabaseInitializer'
-  id = Column(Integer(), primary_key=True)
-  name = Column(String())
-
-
-class TestDatabaseUpdate(Model):
-  __tablename__ = 'TestDatabaseUpdate'
-  id = Column(Integer(), primary_key=True)
-  name = Column(String())
-
-class TestFind(Model):
-  __tablename__ = 'TestFind'
-  client_id = Column(String(), primary_key=True)
-  id = Column(String(), primary_key=True)
-  first_name = Column(String())
-  last_name = Column(String())
-  email = Column(String())
-  state = Column(String())
-  locked = Column(Bit())
-  created_on = Column(Date())
-  updated_on = Column(Date())
-
-
-class TestFullText(Model):
-  __tablename__ = 'TestFullText'
-  client_id = Column(String(), primary_key=True)
-  id = Column(String(), primary_key=True)
-  title = Column(String(), analyze=True)
-  text = Column(String(), analyze=True)
-  published = Column(Bit())
-
-
-@Model.database_initializer
-def _initialize_db(driver: minidb.Driver):
-  driver.add(
-      TestDatabaseInitializer,
-      TestDatabaseInitializer(
-          id=9999,
-          name='created by database initializer'
-      )
-  )
-
-  driver.add(
-      TestDatabaseUpdate,
-      TestDatabaseUpdate(
-          id=9999,
-          name='created by database initializer'
-      )
-  )
-
-  with open(os.path.join(os.path.dirname(__file__), 'find_test_data.json'), 'rb') as fh:
-    test_data = json.loads(fh.read())
-
-  for td in test_data:
-    td['created_on'] = datetime.fromtimestamp(td['created_on'])
-    td['updated_on'] = datetime.fromtimestamp(td['updated_on'])
-
-    doc = TestFind(**td)
-    driver.add(TestFind, doc)
-
-  with open(os.path.join(os.path.dirname(__file__), 'fulltext_test_data.json'), 'rb') as fh:
-    test_data = json.loads(fh.read())
-
-  for td in test_data:
-    doc = TestFullText(**td)
-    driver.add(TestFullText, doc)
-
-
-logging.basicConfig(level=logging.DEBUG)
-Model.build()
-
-
-class SqliteDriverTestCase(unittest.TestCase):
+from minidb.sqlite import ReadOnlyPool
+from ._models import (
+    Model,
+    TestAddMany,
+    TestDatabaseInitializer,
+    TestDatabaseUpdate,
+    TestDocumentWithAutoIncrementPkey,
+    TestDocumentWithDate,
+    TestDocumentWithGeneratedAttribute,
+    TestDocumentWithGeneratedKey,
+    TestDocumentWithoutKey,
+    TestFind,
+    TestFullText,
+    TestFullTextRowid,
+)
+
+# Statement logging is opt-in, since it dominates the cost of the seed load
+logging.basicConfig(
+    level=logging.DEBUG if os.getenv('MINIDB_DEBUG') else logging.WARNING)
+
+# Clients of the seed data the partitioned tests look at
+_FIND_PARTITION = PartitionKey(client_id="9103d3e3-8155-4664-add1-149124d1d9bc")
+_FULLTEXT_PARTITION = PartitionKey(
+    client_id="5a5dfa8d-b821-42c8-ba52-52f4657e18a3")
+
+# The schema and seed data are built once in `_seeded_db`; test classes get
+# a page level copy of it through the backup API.
+_seeded_db = None
+
+
+def _open_db():
+  db = minidb.get_driver('sqlite', {'db_file': ':memory:'})
+  db.connect()
+  return db
+
+
+def _open_seeded_db():
+  global _seeded_db
+  if _seeded_db is None:
+    _seeded_db = _open_db()
+    Model.metadata.create_db(_seeded_db)
+
+  db = _open_db()
+  _seeded_db._con.backup(db._con)
+  return db
+
+
+class _SeededTestCase(unittest.TestCase):
   @classmethod
   def setUpClass(self):
-    self._db = minidb.get_driver('sqlite', {'db_file': ':memory:'})
-    self._db.connect()
-    Model.metadata.create_db(self._db)
+    self._db = _open_seeded_db()
 
   @classmethod
   def tearDownClass(self):
     self._db.close()
 
+
+# Tests that only read the seeded database
+class SqliteDriverReadOnlyTestCase(_SeededTestCase):
   def test_databaseInitialized(self):
     doc = self._db.find_one(TestDatabaseInitializer, 9999)
 
@@ -118,52 +74,19 @@ class SqliteDriverTestCase(unittest.TestCase):
     assert doc.id == 9999
     assert doc.name == 'created by database initializer'
 
-  def test_createAndRetrieveDocWithAutoIncrementPkey(self):
-    expected_doc = TestDocumentWithAutoIncrementPkey(name='foobar')
-    self._db.add(TestDocumentWithAutoIncrementPkey, expected_doc)
-
-    assert expected_doc.id > 0
-
-    doc = self._db.find_one(TestDocumentWithAutoIncrementPkey, expected_doc.id)
-
-    assert not doc is None
-    assert doc.id == expected_doc.id
-    assert doc.name == expected_doc.name
-
-  def test_createAndRetrieveDocWithGeneratedAttribute(self):
-    expected = TestDocumentWithGeneratedAttribute()
-    self._db.add(TestDocumentWithGeneratedAttribute, expected)
-
-    assert expected.id == 1234567890
-
-    doc = self._db.find_one(TestDocumentWithGeneratedAttribute, 1234567890)
-    assert not doc is None
-    assert doc.id == 1234567890
-
-  def test_dateTimePrecisionLoss(self):
-    created_on = datetime.utcnow().replace(microsecond=999999)
-    expected = TestDocumentWithDate(created_on=created_on)
-    self._db.add(TestDocumentWithDate, expected)
-
-    doc = self._db.find_one(TestDocumentWithDate, expected.id)
-    assert not doc is None
-    assert doc.created_on == created_on
+  def test_queryMapsColumnsByName(self):
+    docs = self._db.query(
+        TestDatabaseInitializer,
+        'SELECT name, id FROM TestDatabaseInitializer WHERE id = ?', [9999])
+    assert len(docs) == 1
+    assert docs[0].id == 9999
+    assert docs[0].name == 'created by database initializer'
 
-  def test_databaseUpdate(self):
-    expected_value = 'value has been updated'
-    doc = self._db.find_one(TestDatabaseUpdate, 9999)
-
-    assert not doc is None
-
-    doc.name = expected_value
-
-    self._db.update(TestDatabaseUpdate, doc)
-
-    doc = self._db.find_one(TestDatabaseUpdate, 9999)
-
-    assert not doc is None
-
-    assert doc.name == expected_value
+    docs = self._db.query(
+        TestDatabaseInitializer,
+        'SELECT id FROM TestDatabaseInitializer WHERE id = ?', [9999])
+    assert docs[0].id == 9999
+    assert docs[0].name is None
 
   def test_typedQuery(self):
     docs = self._db.query(TestFind, "SELECT * FROM TestFind where client_id = ?", ['9103d3e3-8155-4664-add1-149124d1d9bc'])
@@ -179,13 +102,31 @@ class SqliteDriverTestCase(unittest.TestCase):
     assert count == 1000
 
   def test_countWithCriteria(self):
-    partition_key = PartitionKey(
-        client_id="9103d3e3-8155-4664-add1-149124d1d9bc")
+    partition_key = _FIND_PARTITION
     count = self._db.count(
         TestFind, {'state': 'active'}, partition_key=partition_key)
 
     assert count == 103
 
+  def test_countWithCriteriaValues(self):
+    # The same criteria shape is reused with different values
+    partition_key = _FIND_PARTITION
+    docs = self._db.find(TestFind, partition_key=partition_key)
+    states = set(doc.state for doc in docs)
+    counts = [self._db.count(TestFind, {'state': state}, partition_key=partition_key)
+              for state in states]
+
+    assert len(states) > 1
+    assert sum(counts) == len(docs)
+
+  def test_exists(self):
+    partition_key = _FIND_PARTITION
+
+    assert self._db.exists(TestFind)
+    assert self._db.exists(
+        TestFind, {'state': 'active'}, partition_key=partition_key)
+    assert not self._db.exists(TestFind, {'state': 'missing'})
+
   def test_findOne(self):
     partition_key = '9103d3e3-8155-4664-add1-149124d1d9bc'
     doc_id = '7801eb5c-4993-4da5-8f01-81a44d091e36'
@@ -208,17 +149,26 @@ class SqliteDriverTestCase(unittest.TestCase):
     assert not docs is None
     assert len(docs) == 1000
 
+  def test_findStream(self):
+    docs = self._db.find(TestFind, stream=True)
+
+    assert not isinstance(docs, list)
+    assert sum(1 for doc in docs) == 1000
+
+    docs = self._db.find(TestFind, sort=[('id', 'ASC')], stream=True)
+    first = next(docs)
+    docs.close()
+    assert first.id == self._db.find(TestFind, sort=[('id', 'ASC')], limit=1)[0].id
+
   def test_findAllWithPartitionKey(self):
-    partition_key = PartitionKey(
-        client_id="9103d3e3-8155-4664-add1-149124d1d9bc")
+    partition_key = _FIND_PARTITION
     docs = self._db.find(TestFind, partition_key=partition_key)
 
     assert not docs is None
     assert len(docs) == 314
 
   def test_find(self):
-    partition_key = PartitionKey(
-        client_id="9103d3e3-8155-4664-add1-149124d1d9bc")
+    partition_key = _FIND_PARTITION
     docs = self._db.find(
         TestFind,
         criteria={'state': 'active'},
@@ -228,39 +178,114 @@ class SqliteDriverTestCase(unittest.TestCase):
 
     assert not docs is None
     assert len(docs) == 103
-    for i in range(0, len(docs)):
-      if i > 0:
-        assert docs[i-1].first_name <= docs[i].first_name
+    names = list(map(attrgetter('first_name'), docs))
+    assert names == sorted(names)
+
+  def test_findWithOperator(self):
+    partition_key = _FIND_PARTITION
+    docs = self._db.find(TestFind, partition_key=partition_key)
+    pivot = sorted(doc.created_on for doc in docs)[len(docs) // 2]
+
+    found = self._db.find(
+        TestFind,
+        criteria={'$gt': ['created_on', pivot]},
+        partition_key=partition_key
+    )
+
+    assert len(found) == len([doc for doc in docs if doc.created_on > pivot])
+    assert all(doc.created_on > pivot for doc in found)
+
+    with self.assertRaises(ValueError):
+      self._db.find(TestFind, criteria={'$like': ['email', '%']})
 
   def test_search(self):
-    partition_key = PartitionKey(
-        client_id="9103d3e3-8155-4664-add1-149124d1d9bc")
+    partition_key = _FIND_PARTITION
     response = self._db.search(
         TestFind,
         criteria={'state': 'active'},
         sort=[('first_name', 'ASC')],
-        partition_key=partition_key
+        partition_key=partition_key,
+        include_total=True
     )
 
     assert not response is None
     assert response.total == 103
     assert response.page_size == 1000
 
-    docs = response.data
+    names = list(map(attrgetter('first_name'), response.data))
+    assert names == sorted(names), "Invalid sort order"
+
+  def test_searchLastOffset(self):
+    partition_key = _FIND_PARTITION
+    response = self._db.search(
+        TestFind,
+        sort=[('id', 'ASC')],
+        offset=313,
+        partition_key=partition_key,
+        include_total=True
+    )
+
+    assert response.total == 314
+    assert len(response.data) == 1
+
+    response = self._db.search(
+        TestFind,
+        sort=[('id', 'ASC')],
+        offset=314,
+        partition_key=partition_key,
+        include_total=True
+    )
+
+    assert response.total == 314
+    assert response.data == []
+
+  def test_searchWithCursor(self):
+    partition_key = _FIND_PARTITION
+    ids = []
+    cursor = self._db.FIRST_PAGE_CURSOR
+    pages = 0
+    while True:
+      response = self._db.search(
+          TestFind,
+          limit=100,
+          partition_key=partition_key,
+          cursor=cursor
+      )
+      pages += 1
+      ids.extend([doc.id for doc in response.data])
+      cursor = response.next_cursor
+      if cursor is None:
+        break
+
+    assert response.total is None
+    assert pages == 4
+    assert len(ids) == 314
+    assert ids == sorted(ids)
+
+  def test_searchWithoutCursor(self):
+    response = self._db.search(
+        TestFind, limit=100, partition_key=_FIND_PARTITION)
 
-    for i in range(0, len(docs)):
-      if i > 0:
-        assert docs[i-1].first_name <= docs[i].first_name, "Invalid sort order"
+    assert response.offset == 0
+    assert response.next_cursor is None
+    assert len(response.data) == 100
+
+    # TestAddMany's single key is not declared as PRIMARY KEY
+    with self.assertRaises(ValueError):
+      self._db.search(
+          TestAddMany, limit=10, cursor=self._db.FIRST_PAGE_CURSOR)
+    with self.assertRaises(ValueError):
+      self._db.search(TestFind, limit=10, cursor='not a cursor')
 
   def test_fullTextSearch(self):
     term = 'early'
-    partition_key = PartitionKey(
-        client_id="5a5dfa8d-b821-42c8-ba52-52f4657e18a3")
+    partition_key = _FULLTEXT_PARTITION
     response = self._db.search(
         TestFullText,
         limit=10,
         partition_key=partition_key,
-        term=term
+        term=term,
+        include_total=True
     )
 
     assert not response is None
@@ -271,31 +296,380 @@ class SqliteDriverTestCase(unittest.TestCase):
 
     docs = response.data
 
-    for i in range(0, len(docs)):
-      assert docs[i].title.find(term) != -1 or docs[i].text.find(term) != -1
+    for doc in docs:
+      assert term in doc.title or term in doc.text
+
+  def test_fullTextSearchTermIsBound(self):
+    count = self._db.count(TestFullText, term='"it\'s early"')
 
-def test_fullTextSearchWithCustomSort(self):
+    assert count == 0
+
+  def test_fullTextSearchWithCustomSort(self):
     term = 'early'
-    partition_key = PartitionKey(
-        client_id="5a5dfa8d-b821-42c8-ba52-52f4657e18a3")
+    partition_key = _FULLTEXT_PARTITION
     response = self._db.search(
         TestFullText,
         limit=10,
         partition_key=partition_key,
         sort=[('text', 'DESC',), ('title', 'DESC',)],
-        term=term
+        term=term,
+        include_total=True
     )
 
     assert not response is None
     assert response.total == 86
-    assert response.page_size == 1000
+    assert response.page_size == 10
 
     docs = response.data
 
-    for i in range(0, len(docs)):
-      assert docs[i].title.find(term) != -1 or docs[i].text.find(term) != -1, "Returned doc contains no instance of term" 
+    for doc in docs:
+      assert term in doc.title or term in doc.text, "Returned doc contains no instance of term"
+
+    keys = [(doc.text, doc.title) for doc in docs]
+    assert keys == sorted(keys, reverse=True), "Invalid sort order"
+
+
+# Tests that write, either to the seeded database or to databases of their
+# own
+class SqliteDriverMutatingTestCase(_SeededTestCase):
+  # Every test runs in a savepoint rolled back afterwards, so writes to the
+  # seeded database do not leak into other tests
+  def setUp(self):
+    self._db._con.execute('SAVEPOINT test')
+
+  def tearDown(self):
+    self._db._con.execute('ROLLBACK TO test')
+    self._db._con.execute('RELEASE test')
+
+  def test_createAndRetrieveDocWithAutoIncrementPkey(self):
+    expected_doc = TestDocumentWithAutoIncrementPkey(name='foobar')
+    self._db.add(TestDocumentWithAutoIncrementPkey, expected_doc)
+
+    assert expected_doc.id > 0
+
+    doc = self._db.find_one(TestDocumentWithAutoIncrementPkey, expected_doc.id)
+
+    assert not doc is None
+    assert doc.id == expected_doc.id
+    assert doc.name == expected_doc.name
+
+  def test_createAndRetrieveDocWithGeneratedAttribute(self):
+    expected = TestDocumentWithGeneratedAttribute()
+    self._db.add(TestDocumentWithGeneratedAttribute, expected)
+
+    assert expected.id == 1234567890
+
+    doc = self._db.find_one(TestDocumentWithGeneratedAttribute, 1234567890)
+    assert not doc is None
+    assert doc.id == 1234567890
+
+  def test_queryWithoutResultSet(self):
+    docs = self._db.query(
+        TestDatabaseInitializer,
+        'UPDATE TestDatabaseInitializer SET name = ? WHERE id = ?',
+        ['updated by query', 9999])
+    assert docs == []
+    assert self._db.find_one(
+        TestDatabaseInitializer, 9999).name == 'updated by query'
+
+  def test_updateDocWithGeneratedKey(self):
+    doc = TestDocumentWithGeneratedKey(name='created')
+    self._db.add(TestDocumentWithGeneratedKey, doc)
+    key = doc.id
+
+    doc.name = 'updated'
+    self._db.update(TestDocumentWithGeneratedKey, doc)
+    assert doc.id == key
+    assert self._db.find_one(TestDocumentWithGeneratedKey, key).name == 'updated'
+
+    doc.name = 'updated again'
+    self._db.update_many(TestDocumentWithGeneratedKey, [doc])
+    assert doc.id == key
+    assert self._db.find_one(TestDocumentWithGeneratedKey, key).name == 'updated again'
+
+  def test_docWithoutKey(self):
+    self._db.add(TestDocumentWithoutKey, TestDocumentWithoutKey(name='a'))
+    self._db.add_many(TestDocumentWithoutKey, [TestDocumentWithoutKey(name='b')])
+
+    assert self._db.count(TestDocumentWithoutKey) == 2
+    assert self._db.count(TestDocumentWithoutKey, {'name': 'b'}) == 1
+    docs = self._db.find(TestDocumentWithoutKey, sort=[('name', 'ASC')])
+    assert [doc.name for doc in docs] == ['a', 'b']
+
+    with self.assertRaises(ValueError):
+      self._db.find_after(TestDocumentWithoutKey)
+
+  def test_dateTimePrecisionLoss(self):
+    created_on = datetime.utcnow().replace(microsecond=999999)
+    expected = TestDocumentWithDate(created_on=created_on)
+    self._db.add(TestDocumentWithDate, expected)
+
+    doc = self._db.find_one(TestDocumentWithDate, expected.id)
+    assert not doc is None
+    assert doc.created_on == created_on
 
-    for i in range(0, len(docs)):
-      if i > 0:
-        assert docs[i-1].text >= docs[i].text and docs[i-1].title >= docs[i].title, "Invalid sort order"
-        
+  def test_databaseUpdate(self):
+    expected_value = 'value has been updated'
+    doc = self._db.find_one(TestDatabaseUpdate, 9999)
+
+    assert not doc is None
+
+    doc.name = expected_value
+
+    self._db.update(TestDatabaseUpdate, doc)
+
+    doc = self._db.find_one(TestDatabaseUpdate, 9999)
+
+    assert not doc is None
+
+    assert doc.name == expected_value
+
+  def test_addMany(self):
+    docs = [TestAddMany(id=i, name='doc %d' % i) for i in range(1, 1201)]
+    self._db.add_many(TestAddMany, docs, chunk_size=500)
+
+    assert self._db.count(TestAddMany) == 1200
+    doc = self._db.find_one(TestAddMany, 1200)
+    assert not doc is None
+    assert doc.name == 'doc 1200'
+
+  def test_addManyWithAutoIncrementPkey(self):
+    docs = [TestDocumentWithAutoIncrementPkey(name='bulk %d' % i) for i in range(3)]
+    self._db.add_many(TestDocumentWithAutoIncrementPkey, docs)
+
+    for doc in docs:
+      assert doc.id > 0
+      assert self._db.find_one(TestDocumentWithAutoIncrementPkey, doc.id).name == doc.name
+
+  def test_addManyValidationError(self):
+    docs = [TestDocumentWithAutoIncrementPkey(),
+            TestDocumentWithAutoIncrementPkey(name='valid'),
+            TestDocumentWithAutoIncrementPkey()]
+    count = self._db.count(TestDocumentWithAutoIncrementPkey)
+
+    for fetch_keys in (True, False):
+      with self.assertRaises(minidb.Driver.DataValidationError) as cm:
+        self._db.add_many(TestDocumentWithAutoIncrementPkey, docs, fetch_keys=fetch_keys)
+
+      message = str(cm.exception)
+      assert '[0]' in message and '[2]' in message
+      assert self._db.count(TestDocumentWithAutoIncrementPkey) == count
+
+  def test_updateManyAndRemoveMany(self):
+    with minidb.get_driver('sqlite', {'db_file': ':memory:'}) as db:
+      db.create_table(TestAddMany.__tablename__, TestAddMany.__table__)
+      docs = [TestAddMany(id=i, name='doc %d' % i) for i in range(10)]
+      db.add_many(TestAddMany, docs)
+
+      for doc in docs:
+        doc.name = doc.name.upper()
+      db.update_many(TestAddMany, docs)
+
+      assert db.find_one(TestAddMany, 9).name == 'DOC 9'
+
+      with self.assertRaises(minidb.Driver.UnaffectedRowsError):
+        db.update_many(TestAddMany, [docs[0], TestAddMany(id=99, name='missing')])
+      assert db.find_one(TestAddMany, 0).name == 'DOC 0'
+
+      db.remove(TestAddMany, 0)
+      db.remove_many(TestAddMany, range(1, 5))
+
+      assert db.count(TestAddMany) == 5
+      assert db.find_one(TestAddMany, 4) is None
+
+  def test_atomic(self):
+    with minidb.get_driver('sqlite', {'db_file': ':memory:'}) as db:
+      db.create_table(TestAddMany.__tablename__, TestAddMany.__table__)
+      with db.atomic():
+        db.add(TestAddMany, TestAddMany(id=1, name='committed'))
+        with db.atomic():
+          db.add(TestAddMany, TestAddMany(id=2, name='joined'))
+
+      with self.assertRaises(minidb.Driver.DataValidationError):
+        with db.atomic():
+          db.add(TestAddMany, TestAddMany(id=3, name='rolled back'))
+          db.add(TestAddMany, TestAddMany(id=4))
+
+      assert db.count(TestAddMany) == 2
+      assert db.find_one(TestAddMany, 3) is None
+
+      # Nested in a transaction opened outside the driver
+      db._con.execute('SAVEPOINT outer')
+      with db.atomic():
+        db.add(TestAddMany, TestAddMany(id=5, name='released'))
+      db._con.execute('ROLLBACK TO outer')
+      db._con.execute('RELEASE outer')
+
+      assert db.find_one(TestAddMany, 5) is None
+
+  def test_pragmasAppliedOnConnect(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      db_file = os.path.join(tmp_dir, 'pragmas.db')
+      with minidb.get_driver('sqlite', {'db_file': db_file}) as db:
+        (journal_mode,) = db._con.execute('PRAGMA journal_mode').fetchone()
+        (synchronous,) = db._con.execute('PRAGMA synchronous').fetchone()
+
+      assert journal_mode == 'wal'
+      assert synchronous == 1
+
+      with minidb.get_driver('sqlite', {'db_file': db_file, 'pragmas': {'synchronous': 'OFF'}}) as db:
+        (journal_mode,) = db._con.execute('PRAGMA journal_mode').fetchone()
+        (synchronous,) = db._con.execute('PRAGMA synchronous').fetchone()
+
+      assert journal_mode == 'wal'
+      assert synchronous == 0
+
+  def test_readPool(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      db_file = os.path.join(tmp_dir, 'pool.db')
+      with minidb.get_driver('sqlite', {'db_file': db_file, 'read_pool_size': 2}) as db:
+        db.create_table(TestAddMany.__tablename__, TestAddMany.__table__)
+        db.add(TestAddMany, TestAddMany(id=1, name='committed'))
+
+        db.begin_transaction()
+        db.add(TestAddMany, TestAddMany(id=2, name='pending'))
+        assert db.count(TestAddMany) == 2
+        db.rollback()
+
+        assert not db._read_pool is None
+        assert db.count(TestAddMany) == 1
+        assert db.find_one(TestAddMany, 1).name == 'committed'
+
+        with self.assertLogs('minidb.sqlite', 'ERROR'):
+          with self.assertRaises(sqlite3.OperationalError):
+            db._execute("DELETE FROM TestAddMany", readonly=True)
+
+  def test_readPoolDuringTransaction(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      db_file = os.path.join(tmp_dir, 'pool.db')
+      with minidb.get_driver('sqlite', {'db_file': db_file, 'read_pool_size': 2}) as db:
+        db.create_table(TestAddMany.__tablename__, TestAddMany.__table__)
+        db.add(TestAddMany, TestAddMany(id=1, name='committed'))
+
+        db.begin_transaction()
+        db.add(TestAddMany, TestAddMany(id=2, name='pending'))
+        counts = []
+        thread = threading.Thread(
+            target=lambda: counts.append(db.count(TestAddMany)))
+        thread.start()
+        thread.join()
+        assert counts == [1]
+        assert db.count(TestAddMany) == 2
+        db.commit()
+
+  def test_readPoolExhausted(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      db_file = os.path.join(tmp_dir, 'pool.db')
+      db = minidb.get_driver('sqlite', {
+          'db_file': db_file, 'read_pool_size': 1, 'read_pool_timeout': 0.01})
+      db.connect()
+      db.create_table(TestAddMany.__tablename__, TestAddMany.__table__)
+      db.add_many(TestAddMany, [TestAddMany(id=i, name='doc %d' % i) for i in range(3)])
+
+      # The open generator holds the only reader; the connecting thread falls
+      # back to the writer while other threads time out
+      docs = db.find(TestAddMany, stream=True)
+      assert next(docs).id == 0
+      assert db.count(TestAddMany) == 3
+
+      errors = []
+      def count():
+        try:
+          db.count(TestAddMany)
+        except ReadOnlyPool.ExhaustedError as e:
+          errors.append(e)
+      thread = threading.Thread(target=count)
+      thread.start()
+      thread.join()
+      assert len(errors) == 1
+
+      # Closing does not wait for the reader held by the generator
+      db.close()
+      docs.close()
+
+  def test_searchResultCache(self):
+    db = minidb.get_driver(
+        'sqlite', {'db_file': ':memory:', 'result_cache_size': 8})
+    with db:
+      db.create_table(TestAddMany.__tablename__, TestAddMany.__table__)
+      db.add_many(TestAddMany, [TestAddMany(id=i, name='doc %02d' % i) for i in range(20)])
+
+      sort = [('name', 'DESC')]
+      first = db.search(TestAddMany, sort=sort, limit=5, offset=0, include_total=True)
+      db._con.execute('DELETE FROM TestAddMany WHERE id = 10')
+      second = db.search(TestAddMany, sort=sort, limit=5, offset=5, include_total=True)
+
+      assert first.total == 20 and second.total == 20
+      assert [doc.id for doc in second.data] == [14, 13, 12, 11, 10]
+
+      db.add(TestAddMany, TestAddMany(id=20, name='doc 20'))
+      third = db.search(TestAddMany, sort=sort, limit=5, offset=5, include_total=True)
+
+      assert third.total == 20
+      assert [doc.id for doc in third.data] == [15, 14, 13, 12, 11]
+
+  def test_searchResultCacheCommit(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      db_file = os.path.join(tmp_dir, 'cache.db')
+      with minidb.get_driver('sqlite', {
+          'db_file': db_file, 'read_pool_size': 2, 'result_cache_size': 8}) as db:
+        db.create_table(TestAddMany.__tablename__, TestAddMany.__table__)
+        db.add(TestAddMany, TestAddMany(id=1, name='committed'))
+
+        # Another thread caches the committed rows while the insert is pending
+        db.begin_transaction()
+        db.add(TestAddMany, TestAddMany(id=2, name='pending'))
+        totals = []
+        thread = threading.Thread(target=lambda: totals.append(
+            db.search(TestAddMany, limit=5, include_total=True).total))
+        thread.start()
+        thread.join()
+        db.commit()
+
+        assert totals == [1]
+        assert db.search(TestAddMany, limit=5, include_total=True).total == 2
+
+  def test_rebuildFullTextIndex(self):
+    count = self._db.count(TestFullText, term='early')
+    self._db.rebuild_fts(TestFullText)
+
+    assert count > 0
+    assert self._db.count(TestFullText, term='early') == count
+
+    with self.assertRaises(ValueError):
+      self._db.rebuild_fts(TestFind)
+
+  def test_fullTextExternalContent(self):
+    with minidb.get_driver('sqlite', {'db_file': ':memory:'}) as db:
+      db.create_table(TestFullTextRowid.__tablename__, TestFullTextRowid.__table__)
+      for title in ['early bird', 'early riser', 'night owl']:
+        db.add(TestFullTextRowid, TestFullTextRowid(client_id='a', title=title))
+
+      assert db.count(TestFullTextRowid, term='early') == 2
+      assert db.count(TestFullTextRowid, {'client_id': 'a'}, term='early') == 2
+      docs = db.find(TestFullTextRowid, term='owl')
+      assert [doc.title for doc in docs] == ['night owl']
+
+      docs[0].title = 'early owl'
+      db.update(TestFullTextRowid, docs[0])
+      db.remove(TestFullTextRowid, 1)
+      db.rebuild_fts(TestFullTextRowid)
+
+      assert db.count(TestFullTextRowid, term='early') == 2
+      assert db.count(TestFullTextRowid, term='bird') == 0
+      assert db.count(TestFullTextRowid, term='night') == 0
+
+  def test_fullTextUpdateAndRemove(self):
+    with minidb.get_driver('sqlite', {'db_file': ':memory:'}) as db:
+      db.create_table(TestFullText.__tablename__, TestFullText.__table__)
+      doc = TestFullText(
+          client_id='a', id='1', title='early bird', text='', published=1)
+      db.add(TestFullText, doc)
+
+      doc.title = 'night owl'
+      db.update(TestFullText, doc)
+      assert db.count(TestFullText, term='early') == 0
+      assert db.count(TestFullText, term='owl') == 1
+
+      db.remove(TestFullText, {'client_id': 'a', 'id': '1'})
+      assert db.count(TestFullText, term='owl') == 0